@@ -0,0 +1,79 @@
+# backend/benchmarks/chunking_throughput.py
+"""
+Chunking benchmark: character-sized vs token-sized RecursiveCharacterTextSplitter.
+
+Splits the same text with both configurations of rag's splitter and reports
+throughput (MB/s), chunk count, and chunk sizes in embedding-model tokens,
+including how many chunks exceed the model's 256-token window (and would be
+silently truncated at embedding time). The token splitter is run twice to show
+the effect of the memoized token counts.
+
+Usage:
+    python -m backend.benchmarks.chunking_throughput --mb 2
+    python -m backend.benchmarks.chunking_throughput --file uploads/notes.txt
+"""
+import argparse
+import random
+import statistics
+import time
+
+from backend.benchmarks.embedding_throughput import WORDS
+
+MODEL_MAX_TOKENS = 256
+
+
+def make_text(megabytes: float, seed: int = 5) -> str:
+    rng = random.Random(seed)
+    target = int(megabytes * 1024 * 1024)
+    paragraphs, length = [], 0
+    while length < target:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(6, 24))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def run(label: str, splitter, text: str):
+    from backend.tokenization import count_tokens
+
+    started = time.perf_counter()
+    chunks = splitter.split_text(text)
+    elapsed = time.perf_counter() - started
+    tokens = [count_tokens(c) for c in chunks]
+    over = sum(1 for t in tokens if t > MODEL_MAX_TOKENS)
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print(f"{label:>16} {mb / elapsed:>8.2f} {len(chunks):>8} {statistics.mean(tokens):>10.1f} "
+          f"{max(tokens):>10} {over:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Character vs token chunking benchmark.")
+    parser.add_argument("--mb", type=float, default=2.0, help="Size of the synthetic text in MB (default: 2)")
+    parser.add_argument("--file", default=None, help="Use this UTF-8 text file instead of synthetic text")
+    args = parser.parse_args()
+
+    from backend.rag import _get_text_splitter
+    from backend.tokenization import get_tokenizer
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+    else:
+        text = make_text(args.mb)
+    get_tokenizer()  # load outside the timed region
+
+    print("=" * 70)
+    print(f"CHUNKING THROUGHPUT - {len(text) / (1024 * 1024):.2f} MB")
+    print("=" * 70)
+    print(f"{'splitter':>16} {'MB/s':>8} {'chunks':>8} {'avg tok':>10} {'max tok':>10} {'>' + str(MODEL_MAX_TOKENS) + ' tok':>10}")
+    run("chars", _get_text_splitter("chars"), text)
+    run("tokens (cold)", _get_text_splitter("tokens"), text)
+    run("tokens (warm)", _get_text_splitter("tokens"), text)
+
+
+if __name__ == "__main__":
+    main()
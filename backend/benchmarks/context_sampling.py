@@ -0,0 +1,67 @@
+# backend/benchmarks/context_sampling.py
+"""
+Cost and topic coverage of document-context sampling modes.
+
+Builds synthetic documents whose chunk embeddings come from a known number of
+topics (clusters in 384-d space, topics laid out in contiguous sections of
+varying length), then times each sampling mode and reports the share of topics
+that made it into the sampled context.
+
+Usage:
+    python -m backend.benchmarks.context_sampling --chunks 500,2000,5000 --topics 40
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend.context_selection import diverse_chunk_indexes
+
+DIM = 384
+
+
+def make_document(chunks: int, topics: int, seed: int = 3):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, DIM)).astype(np.float32)
+    # Contiguous sections of random length, like chapters
+    weights = rng.dirichlet(np.ones(topics) * 0.5)
+    sizes = np.maximum(1, np.round(weights * chunks)).astype(int)
+    labels = np.repeat(np.arange(topics), sizes)[:chunks]
+    if len(labels) < chunks:
+        labels = np.concatenate([labels, np.full(chunks - len(labels), topics - 1)])
+    vectors = centers[labels] + 0.6 * rng.normal(size=(chunks, DIM)).astype(np.float32)
+    lengths = rng.integers(700, 1000, size=chunks).tolist()
+    return vectors, lengths, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document context sampling benchmark.")
+    parser.add_argument("--chunks", default="500,2000,5000", help="Comma-separated document sizes in chunks")
+    parser.add_argument("--topics", type=int, default=40, help="Topics per document (default: 40)")
+    parser.add_argument("--max-chars", type=int, default=18000, help="Context budget (default: 18000)")
+    args = parser.parse_args()
+
+    from backend.rag import _sample_chunk_indexes
+
+    print("=" * 64)
+    print(f"CONTEXT SAMPLING - {args.topics} topics, budget {args.max_chars} chars")
+    print("=" * 64)
+    print(f"{'chunks':>7} {'mode':>9} {'ms':>9} {'chunks kept':>12} {'topics covered':>15}")
+    for n in [int(x) for x in args.chunks.split(",")]:
+        vectors, lengths, labels = make_document(n, args.topics)
+        total_topics = len(set(labels.tolist()))
+        modes = {
+            "position": lambda: _sample_chunk_indexes(lengths, args.max_chars),
+            "farthest": lambda: diverse_chunk_indexes(vectors, lengths, args.max_chars, "farthest"),
+            "kmeans": lambda: diverse_chunk_indexes(vectors, lengths, args.max_chars, "kmeans"),
+        }
+        for mode, select in modes.items():
+            started = time.perf_counter()
+            chosen = select()
+            elapsed = (time.perf_counter() - started) * 1000.0
+            covered = len(set(labels[chosen].tolist()))
+            print(f"{n:>7} {mode:>9} {elapsed:>9.1f} {len(chosen):>12} {covered:>9}/{total_topics:<5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# backend/benchmarks/embedding_backends.py
+"""
+Compares embedding backends (PyTorch vs int8-quantized ONNX) on CPU.
+
+For each backend it reports single-query latency (p50/p95), batch throughput
+(chunks/second), and recall@k of nearest-neighbour search over the corpus
+against the PyTorch backend as ground truth. Recall is measured both with the
+corpus embedded by the same backend (full re-index) and with the corpus
+embedded by PyTorch (querying the existing collection without re-indexing).
+
+Chunks come from the knowledge base when it has enough, otherwise synthetic.
+
+Usage:
+    python -m backend.benchmarks.embedding_backends --backends torch,onnx --chunks 1000 --queries 100 --k 5
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from backend.benchmarks.embedding_throughput import make_chunks
+
+
+def load_chunks(count: int) -> list:
+    try:
+        from backend.rag import get_collection
+        found = get_collection().get(limit=count, include=["documents"])
+        chunks = [doc for doc in found.get("documents") or [] if doc and doc.strip()]
+        if len(chunks) >= count // 2:
+            return chunks
+    except Exception as e:
+        print(f"Knowledge base unavailable ({e}), using synthetic chunks")
+    return make_chunks(count)
+
+
+def make_queries(chunks: list, count: int, seed: int = 11) -> list:
+    """Short queries made from a run of words inside random chunks."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.choice(chunks).split()
+        start = rng.randrange(max(1, len(words) - 8))
+        queries.append(" ".join(words[start:start + 8]))
+    return queries
+
+
+def normalized(vectors) -> np.ndarray:
+    m = np.asarray(vectors, dtype=np.float32)
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(query_vectors: np.ndarray, corpus_vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = query_vectors @ corpus_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+
+def measure(embeddings, chunks: list, queries: list, batch_size: int) -> dict:
+    embeddings.embed_documents(chunks[:batch_size])  # warm-up
+    embeddings.embed_query(queries[0])
+
+    latencies = []
+    query_vectors = []
+    for q in queries:
+        started = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(q))
+        latencies.append((time.perf_counter() - started) * 1000.0)
+
+    started = time.perf_counter()
+    corpus_vectors = []
+    for start in range(0, len(chunks), batch_size):
+        corpus_vectors.extend(embeddings.embed_documents(chunks[start:start + batch_size]))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "chunks_per_s": len(chunks) / elapsed,
+        "queries": normalized(query_vectors),
+        "corpus": normalized(corpus_vectors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend latency / throughput / recall@k benchmark.")
+    parser.add_argument("--backends", default="torch,onnx", help="Comma-separated backends; the first is the reference")
+    parser.add_argument("--chunks", type=int, default=1000, help="Corpus size (default: 1000)")
+    parser.add_argument("--queries", type=int, default=100, help="Number of queries (default: 100)")
+    parser.add_argument("--k", type=int, default=5, help="k for recall@k (default: 5)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size for corpus embedding")
+    args = parser.parse_args()
+
+    from backend.rag import create_embedding_function
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    chunks = load_chunks(args.chunks)
+    queries = make_queries(chunks, args.queries)
+
+    results = {}
+    for backend in backends:
+        print(f"Loading {backend} backend...")
+        results[backend] = measure(create_embedding_function(backend), chunks, queries, args.batch_size)
+
+    reference = results[backends[0]]
+    truth = top_k(reference["queries"], reference["corpus"], args.k)
+
+    print("=" * 78)
+    print(f"EMBEDDING BACKENDS - {len(chunks)} chunks, {len(queries)} queries, reference: {backends[0]}")
+    print("=" * 78)
+    print(f"{'backend':>8} {'p50 ms':>8} {'p95 ms':>8} {'chunks/s':>10} "
+          f"{'recall@' + str(args.k) + ' reindexed':>20} {'recall@' + str(args.k) + ' mixed':>16}")
+    for backend in backends:
+        r = results[backend]
+        reindexed = recall_at_k(truth, top_k(r["queries"], r["corpus"], args.k))
+        mixed = recall_at_k(truth, top_k(r["queries"], reference["corpus"], args.k))
+        print(f"{backend:>8} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['chunks_per_s']:>10.1f} "
+              f"{reindexed:>20.3f} {mixed:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
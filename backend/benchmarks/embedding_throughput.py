@@ -0,0 +1,86 @@
+# backend/benchmarks/embedding_throughput.py
+"""
+Micro-benchmark for the ingestion embedding engine on CPU.
+
+Embeds a fixed set of ~1000-character chunks through EmbeddingEngine for every
+combination of batch size and intra-op thread count, and reports chunks/second,
+so EMBED_BATCH_SIZE / EMBED_THREADS can be tuned per node type.
+
+Usage:
+    python -m backend.benchmarks.embedding_throughput --chunks 512 --batch-sizes 8,16,32,64 --threads 1,2,4
+"""
+import argparse
+import os
+import random
+import time
+
+from backend.embedding_engine import EmbeddingEngine, set_intra_op_threads
+
+WORDS = (
+    "photosynthesis chlorophyll energy light reaction glucose carbon dioxide oxygen enzyme cell "
+    "membrane algorithm complexity recursion graph tree sorting dynamic programming matrix vector "
+    "probability distribution theorem proof derivative integral function module lecture exam"
+).split()
+
+
+def make_chunks(count: int, chars: int = 1000, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        words, length = [], 0
+        while length < chars:
+            w = rng.choice(WORDS)
+            words.append(w)
+            length += len(w) + 1
+        chunks.append(" ".join(words)[:chars])
+    return chunks
+
+
+def run_config(embeddings, chunks: list, batch_size: int, threads: int, queue_size: int) -> float:
+    """Returns chunks/second for one configuration, going through the same pipeline ingestion uses."""
+    set_intra_op_threads(threads)
+    engine = EmbeddingEngine(embeddings, batch_size=batch_size, num_threads=threads, queue_size=queue_size)
+    engine.embed_documents(chunks[:batch_size])  # warm-up pass
+
+    started = time.perf_counter()
+    with engine.pipeline(lambda texts, vectors, payload: None) as pipeline:
+        for start in range(0, len(chunks), batch_size):
+            pipeline.submit(chunks[start:start + batch_size])
+    elapsed = time.perf_counter() - started
+    return len(chunks) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding engine throughput benchmark (chunks/second).")
+    parser.add_argument("--chunks", type=int, default=512, help="Number of synthetic chunks (default: 512)")
+    parser.add_argument("--batch-sizes", default="8,16,32,64", help="Comma-separated batch sizes")
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1), help="Comma-separated intra-op thread counts")
+    parser.add_argument("--queue-size", type=int, default=4, help="Bounded queue size (batches)")
+    args = parser.parse_args()
+
+    from backend.rag import get_embedding_function
+
+    batch_sizes = [int(x) for x in args.batch_sizes.split(",")]
+    thread_counts = [int(x) for x in args.threads.split(",")]
+    chunks = make_chunks(args.chunks)
+    embeddings = get_embedding_function()
+
+    print("=" * 60)
+    print(f"EMBEDDING THROUGHPUT - {len(chunks)} chunks x ~1000 chars, CPU")
+    print("=" * 60)
+    print(f"{'batch':>6} {'threads':>8} {'chunks/s':>10}")
+
+    best = None
+    for threads in thread_counts:
+        for batch_size in batch_sizes:
+            rate = run_config(embeddings, chunks, batch_size, threads, args.queue_size)
+            print(f"{batch_size:>6} {threads:>8} {rate:>10.1f}")
+            if best is None or rate > best[0]:
+                best = (rate, batch_size, threads)
+
+    print("-" * 60)
+    print(f"Best: EMBED_BATCH_SIZE={best[1]} EMBED_THREADS={best[2]} ({best[0]:.1f} chunks/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# backend/bulk_ingest.py
+"""
+Bulk directory ingestion.
+
+Walks a directory, extracts and embeds every supported file with a pool of
+workers, and checkpoints progress to a JSON file so an interrupted run can be
+resumed. Files are registered in the document registry like HTTP uploads, so
+duplicates are skipped and changed files are re-ingested incrementally.
+
+Usage:
+    python -m backend.bulk_ingest uploads/ --workers 4
+    python -m backend.bulk_ingest uploads/ --workers 4 --resume
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+from backend import documents, summaries, text_store
+from backend.ingest_utils import SUPPORTED_EXTENSIONS
+from backend.models import create_tables, get_engine
+
+CHECKPOINT_NAME = ".bulk_ingest_checkpoint.json"
+
+
+class Checkpoint:
+    """JSON checkpoint of processed files: relative path -> {sha256, status, chunks, mtime, size}."""
+
+    def __init__(self, path: str, resume: bool):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def record(self, rel_path: str, entry: dict):
+        with self._lock:
+            self.entries[rel_path] = entry
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+def find_files(root: str):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                yield os.path.join(dirpath, name)
+
+
+def bulk_file_id(rel_path: str) -> str:
+    """
+    Slash-free file_id for a file under the ingested root, like the basename-style ids of
+    uploads: "course/week1/notes.pdf" -> "course__week1__notes_<hash of the path>.pdf".
+    Deterministic, so re-runs over the same tree address the same documents.
+    """
+    stem, ext = os.path.splitext(rel_path)
+    digest = hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:8]
+    return f"{stem.replace('/', '__')}_{digest}{ext}"
+
+
+def ingest_file(path: str, rel_path: str, user_id: str, user_role: str) -> dict:
+    """Registers, extracts and embeds one file. Returns a checkpoint entry."""
+    from backend.rag import ingest_pages
+
+    sha256 = text_store.file_sha256(path)
+    db = documents.SessionLocal()
+    try:
+        doc, is_new = documents.register_upload(
+            db, sha256=sha256, file_id=bulk_file_id(rel_path), saved_path=path, original_filename=rel_path,
+            file_type=os.path.splitext(path)[1].lower(), size_bytes=os.path.getsize(path),
+            user_id=user_id, user_role=user_role,
+        )
+        file_id, version = doc.file_id, doc.version
+    finally:
+        db.close()
+
+    if not is_new:
+        return {"sha256": sha256, "file_id": file_id, "status": "duplicate", "chunks": 0}
+
+    try:
+        pages = list(text_store.iter_document_pages(path, sha256=sha256))
+        text = "\n".join(page_text for _, page_text in pages)
+        if not text or len(text.strip()) < 10:
+            documents.update_document(file_id, status=documents.STATUS_EMPTY, text_length=len(text or ""))
+            return {"sha256": sha256, "file_id": file_id, "status": documents.STATUS_EMPTY, "chunks": 0}
+        stats = ingest_pages(file_id, pages, version=version)
+    except Exception:
+        documents.update_document(file_id, status=documents.STATUS_FAILED)
+        raise
+
+    documents.update_document(
+        file_id, status=documents.STATUS_INGESTED, chunk_count=stats["chunks_total"], text_length=len(text)
+    )
+    # Summaries stored before this ingestion finished are regenerated on first request
+    summaries.invalidate(file_id)
+    return {
+        "sha256": sha256,
+        "file_id": file_id,
+        "status": documents.STATUS_INGESTED,
+        "chunks": stats["chunks_total"],
+        "chunks_embedded": stats["chunks_embedded"],
+    }
+
+
+def run(root: str, workers: int, resume: bool, checkpoint_path: str, user_id: str, user_role: str):
+    create_tables(get_engine())
+    checkpoint = Checkpoint(checkpoint_path, resume)
+
+    files = list(find_files(root))
+    todo = []
+    for path in files:
+        rel_path = os.path.relpath(path, root).replace(os.sep, "/")
+        entry = checkpoint.entries.get(rel_path)
+        # Cheap skip: size and mtime unchanged since the checkpointed run
+        if resume and entry and entry.get("status") != documents.STATUS_FAILED \
+                and entry.get("mtime") == os.path.getmtime(path) and entry.get("size") == os.path.getsize(path):
+            continue
+        todo.append((path, rel_path))
+
+    print(f"Found {len(files)} files, {len(files) - len(todo)} already done, {len(todo)} to ingest with {workers} workers")
+
+    started = time.perf_counter()
+    done = failed = chunks = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_file, path, rel_path, user_id, user_role): (path, rel_path) for path, rel_path in todo}
+        for future in as_completed(futures):
+            path, rel_path = futures[future]
+            try:
+                entry = future.result()
+                chunks += entry.get("chunks_embedded", 0)
+                done += 1
+            except Exception as e:
+                entry = {"status": documents.STATUS_FAILED, "error": str(e)}
+                failed += 1
+            entry["mtime"] = os.path.getmtime(path)
+            entry["size"] = os.path.getsize(path)
+            checkpoint.record(rel_path, entry)
+
+            elapsed = time.perf_counter() - started
+            print(
+                f"[{done + failed}/{len(todo)}] {entry['status']:>9} {rel_path} "
+                f"({done / elapsed:.2f} files/s, {chunks / elapsed:.1f} chunks/s)"
+            )
+
+    elapsed = time.perf_counter() - started
+    print("=" * 60)
+    print(f"Ingested {done} files ({failed} failed), embedded {chunks} chunks in {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"Throughput: {done / elapsed:.2f} files/s, {chunks / elapsed:.1f} chunks/s")
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of course material into the knowledge base.")
+    parser.add_argument("directory", help="Directory to walk (recursively)")
+    parser.add_argument("--workers", type=int, default=4, help="Files processed in parallel (default: 4)")
+    parser.add_argument("--resume", action="store_true", help="Skip files finished by a previous run")
+    parser.add_argument("--checkpoint", default=None, help=f"Checkpoint file (default: <directory>/{CHECKPOINT_NAME})")
+    parser.add_argument("--user-id", default="bulk_ingest", help="Owner recorded in the document registry")
+    parser.add_argument("--user-role", default="teacher", help="Owner role recorded in the document registry")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.directory)
+    checkpoint_path = args.checkpoint or os.path.join(root, CHECKPOINT_NAME)
+    ok = run(root, args.workers, args.resume, checkpoint_path, args.user_id, args.user_role)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
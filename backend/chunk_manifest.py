@@ -0,0 +1,106 @@
+# backend/chunk_manifest.py
+"""
+Per-document chunk manifests and a cache of assembled document contexts.
+
+A manifest records, for one source (file_id), the ids of its chunks in
+document order together with their lengths and the document version. With it,
+get_smart_document_context can decide which chunks to sample without reading
+the document, fetch only those chunks, and cache the assembled result per
+(file_id, max_chars, version, sampling mode). Writing a new manifest drops
+that source's cached contexts.
+"""
+import json
+import os
+import sqlite3
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_MANIFEST_PATH = os.getenv("CHUNK_MANIFEST_PATH", os.path.join(PROJECT_ROOT, "chunk_manifest.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifests (
+    source TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    chunk_ids TEXT NOT NULL,
+    lengths TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contexts (
+    source TEXT NOT NULL,
+    max_chars INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (source, max_chars, version, mode)
+) WITHOUT ROWID;
+"""
+
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(CHUNK_MANIFEST_PATH, timeout=30)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(contexts)")}
+        if columns and "mode" not in columns:
+            # Created before contexts were keyed by sampling mode; it only holds a cache, so rebuild it
+            conn.execute("DROP TABLE contexts")
+        conn.executescript(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def put(source: str, version: int, chunk_ids: list, lengths: list):
+    """Replaces the manifest of a source and invalidates its cached contexts."""
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO manifests (source, version, chunk_ids, lengths, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (source, version, json.dumps(chunk_ids), json.dumps(lengths), time.time()),
+        )
+        conn.execute("DELETE FROM contexts WHERE source = ?", (source,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get(source: str):
+    """{"version", "chunk_ids", "lengths"} or None."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT version, chunk_ids, lengths FROM manifests WHERE source = ?", (source,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"version": row[0], "chunk_ids": json.loads(row[1]), "lengths": json.loads(row[2])}
+
+
+def get_context(source: str, max_chars: int, version: int, mode: str):
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT text FROM contexts WHERE source = ? AND max_chars = ? AND version = ? AND mode = ?",
+            (source, max_chars, version, mode),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def put_context(source: str, max_chars: int, version: int, mode: str, text: str):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO contexts (source, max_chars, version, mode, text, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (source, max_chars, version, mode, text, time.time()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,211 @@
+# backend/context_selection.py
+"""
+Post-retrieval selection of chunks for LLM prompts.
+
+Chunks are split with an overlap, so top-k results often contain neighbouring
+chunks of the same document that repeat part of each other's text, or
+near-duplicates from different documents. This module picks a diverse subset
+with maximal marginal relevance (MMR) and then merges chunks that are adjacent
+in their source into one passage, dropping the duplicated overlap.
+
+It also samples whole documents for summarization by topic coverage
+(k-means or farthest-point sampling over the stored chunk embeddings) instead
+of by position.
+"""
+import numpy as np
+
+from langchain_core.documents import Document
+
+# Overlaps shorter than this are not stripped (too likely to be a coincidental match)
+MIN_OVERLAP_CHARS = 16
+# Prefix of the following chunk used to look for the overlap in the previous one
+_ANCHOR_CHARS = 32
+
+
+def overlap_length(previous: str, following: str) -> int:
+    """Length of the longest suffix of `previous` that is also a prefix of `following`."""
+    if not previous or not following:
+        return 0
+    anchor = following[:min(_ANCHOR_CHARS, len(following))]
+    # Scan left to right so the longest overlap wins over a coincidental short one
+    pos = previous.find(anchor, max(0, len(previous) - len(following)))
+    while pos >= 0:
+        size = len(previous) - pos
+        if size < MIN_OVERLAP_CHARS:
+            return 0
+        if following.startswith(previous[pos:]):
+            return size
+        pos = previous.find(anchor, pos + 1)
+    return 0
+
+
+def join_without_overlap(previous: str, following: str) -> str:
+    size = overlap_length(previous, following)
+    if size:
+        return previous + following[size:]
+    return f"{previous}\n{following}"
+
+
+def mmr_select(query_vector, vectors, k: int, lambda_mult: float = 0.7) -> list:
+    """
+    Maximal marginal relevance over candidate vectors (already in relevance order).
+    The first candidate is always kept, so the retriever's best hit is never dropped.
+    Returns the selected candidate positions in selection order.
+    """
+    if len(vectors) == 0 or k <= 0:
+        return []
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = matrix @ query
+    selected = [0]
+    # Highest similarity of each candidate to anything selected so far
+    redundancy = matrix @ matrix[0]
+    while len(selected) < min(k, len(matrix)):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+    return selected
+
+
+def merge_adjacent(docs: list) -> list:
+    """
+    Merges documents whose metadata has the same source and consecutive chunk_index into
+    one Document, stripping the overlapping text. Each merged run is placed where its
+    best-ranked member was; metadata gets chunk_index_end for runs of several chunks.
+    """
+    by_key = {}
+    for rank, doc in enumerate(docs):
+        meta = doc.metadata or {}
+        by_key[(meta.get("source"), meta.get("chunk_index"))] = rank
+
+    runs = []
+    consumed = set()
+    for rank, doc in enumerate(docs):
+        if rank in consumed:
+            continue
+        source, index = (doc.metadata or {}).get("source"), (doc.metadata or {}).get("chunk_index")
+        if index is None:
+            runs.append((rank, [doc]))
+            consumed.add(rank)
+            continue
+        # Walk back to the start of the run, then forward to its end
+        start = index
+        while (source, start - 1) in by_key and by_key[(source, start - 1)] not in consumed:
+            start -= 1
+        members, i = [], start
+        while (source, i) in by_key and by_key[(source, i)] not in consumed:
+            members.append(by_key[(source, i)])
+            i += 1
+        consumed.update(members)
+        runs.append((min(members), [docs[m] for m in members]))
+
+    merged = []
+    for _, members in sorted(runs, key=lambda run: run[0]):
+        if len(members) == 1:
+            merged.append(members[0])
+            continue
+        text = members[0].page_content
+        for doc in members[1:]:
+            text = join_without_overlap(text, doc.page_content)
+        metadata = dict(members[0].metadata)
+        metadata["chunk_index_end"] = members[-1].metadata.get("chunk_index")
+        merged.append(Document(page_content=text, metadata=metadata, id=members[0].id))
+    return merged
+
+
+# --- Whole-document sampling ------------------------------------------------------
+
+def _normalize_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def farthest_point_order(vectors, n: int, first: int = 0) -> list:
+    """
+    Greedy farthest-point sampling (cosine distance): starts at `first` and repeatedly adds
+    the chunk least similar to everything chosen so far. Returns up to n indexes in pick order.
+    """
+    matrix = _normalize_rows(vectors)
+    n = min(n, len(matrix))
+    if n <= 0:
+        return []
+    order = [first]
+    closest = matrix @ matrix[first]
+    while len(order) < n:
+        closest[order] = np.inf
+        pick = int(np.argmin(closest))
+        order.append(pick)
+        closest = np.maximum(closest, matrix @ matrix[pick])
+    return order
+
+
+def kmeans_representatives(vectors, n_clusters: int, iterations: int = 10) -> list:
+    """
+    Spherical k-means (farthest-point initialisation, a few Lloyd iterations). Returns the
+    chunk closest to each centroid, largest clusters first.
+    """
+    matrix = _normalize_rows(vectors)
+    n_clusters = min(n_clusters, len(matrix))
+    if n_clusters <= 0:
+        return []
+    centroids = matrix[farthest_point_order(matrix, n_clusters)]
+    for _ in range(iterations):
+        labels = np.argmax(matrix @ centroids.T, axis=1)
+        assignment = np.zeros((n_clusters, len(matrix)), dtype=np.float32)
+        assignment[labels, np.arange(len(matrix))] = 1.0
+        sums = assignment @ matrix
+        counts = np.bincount(labels, minlength=n_clusters)
+        nonempty = counts > 0
+        centroids[nonempty] = _normalize_rows(sums[nonempty])
+
+    similarity = matrix @ centroids.T
+    labels = np.argmax(similarity, axis=1)
+    counts = np.bincount(labels, minlength=n_clusters)
+    representatives = []
+    for cluster in np.argsort(-counts):
+        if counts[cluster] == 0:
+            continue
+        members = np.flatnonzero(labels == cluster)
+        representatives.append(int(members[np.argmax(similarity[members, cluster])]))
+    return representatives
+
+
+def diverse_chunk_indexes(vectors, lengths: list, max_chars: int, method: str = "kmeans") -> list:
+    """
+    Chooses chunks that cover the document's topics within max_chars (joined with blank lines),
+    using only the stored chunk embeddings. method is "kmeans" or "farthest".
+    Returns the chosen indexes in document order.
+    """
+    total = len(lengths)
+    if total == 0:
+        return []
+    if sum(lengths) + 2 * (total - 1) <= max_chars:
+        return list(range(total))
+
+    # Over-provision candidates; the char budget decides how many are kept
+    avg_length = (sum(lengths) / total) + 2
+    n_candidates = min(total, max(1, int(max_chars / avg_length) * 2))
+    if method == "farthest":
+        candidates = farthest_point_order(vectors, n_candidates)
+    elif method == "kmeans":
+        candidates = kmeans_representatives(vectors, max(1, n_candidates // 2))
+        seen = set(candidates)
+        candidates += [i for i in farthest_point_order(vectors, n_candidates) if i not in seen]
+    else:
+        raise ValueError(f"Unknown sampling method: {method!r}")
+
+    chosen, used = [], 0
+    for i in candidates:
+        cost = lengths[i] + (2 if chosen else 0)
+        if used + cost <= max_chars:
+            chosen.append(i)
+            used += cost
+    if not chosen:
+        # Every chunk is over the budget: keep the most representative one, like position sampling keeps the head
+        chosen = [candidates[0]]
+    return sorted(chosen)
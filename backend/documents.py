@@ -0,0 +1,189 @@
+# backend/documents.py
+"""
+Content-addressed document registry.
+
+Uploads are identified by the SHA-256 of their bytes. The first upload of a
+given file is extracted and embedded under its own file_id; later uploads of
+the same bytes only record a DocumentAlias and reuse that file_id, so the
+vector store holds one copy of every distinct document.
+"""
+import os
+import uuid
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.db import SessionLocal
+from backend.models import UploadedDocument, DocumentAlias
+
+STATUS_PENDING = "pending"
+STATUS_INGESTED = "ingested"
+STATUS_EMPTY = "empty"
+STATUS_FAILED = "failed"
+
+# Registration retries with a suffixed file_id when another document already holds the requested one
+FILE_ID_ATTEMPTS = 5
+
+
+class RevisionInProgressError(RuntimeError):
+    """Raised when a new version is uploaded while the previous one is still being ingested."""
+
+
+def _suffixed_file_id(file_id: str) -> str:
+    base, ext = os.path.splitext(file_id)
+    return f"{base}_{uuid.uuid4().hex[:8]}{ext}"
+
+
+def find_by_hash(db: Session, sha256: str):
+    return db.execute(select(UploadedDocument).where(UploadedDocument.sha256 == sha256)).scalars().first()
+
+
+def find_by_file_id(db: Session, file_id: str):
+    return db.execute(select(UploadedDocument).where(UploadedDocument.file_id == file_id)).scalars().first()
+
+
+def find_previous_version(db: Session, user_id: str, user_role: str, original_filename: str):
+    """
+    The document this owner last uploaded under the same filename, if nobody else shares it.
+    A new upload matching it is treated as a revision of that document.
+    """
+    doc = db.execute(
+        select(UploadedDocument)
+        .join(DocumentAlias, DocumentAlias.document_id == UploadedDocument.id)
+        .where(
+            DocumentAlias.user_id == user_id,
+            DocumentAlias.user_role == user_role,
+            DocumentAlias.original_filename == original_filename,
+        )
+        .order_by(DocumentAlias.created_at.desc())
+    ).scalars().first()
+    if doc is None:
+        return None
+    # Documents shared with other owners (via dedup) are never revised in place
+    if any(a.user_id != user_id or a.user_role != user_role for a in doc.aliases):
+        return None
+    return doc
+
+
+def add_alias(db: Session, doc: UploadedDocument, user_id: str, user_role: str, original_filename: str):
+    alias = DocumentAlias(
+        document_id=doc.id,
+        user_id=user_id,
+        user_role=user_role,
+        original_filename=original_filename,
+    )
+    db.add(alias)
+    db.commit()
+    return alias
+
+
+def register_upload(db: Session, sha256: str, file_id: str, saved_path: str, original_filename: str,
+                    file_type: str, size_bytes: int, user_id: str, user_role: str, revise: bool = True):
+    """
+    Registers a freshly saved upload.
+    Returns (document, is_new). When is_new is False the bytes were already known and
+    the caller should reuse document.file_id instead of ingesting the new copy.
+    A changed file re-uploaded by the same owner under the same name becomes a new version
+    of the existing document: it keeps its file_id and is re-ingested incrementally.
+    Raises RevisionInProgressError when that document's previous version is still pending,
+    since two ingestions of one file_id would reuse and delete each other's chunks.
+    With revise=False a changed file always becomes a new document.
+    """
+    doc = find_by_hash(db, sha256)
+    if doc is not None and doc.status != STATUS_FAILED:
+        add_alias(db, doc, user_id, user_role, original_filename)
+        return doc, False
+
+    if doc is not None:
+        # Previous ingestion of these bytes failed: retry it from the new copy under the same file_id
+        doc.saved_path = saved_path
+        doc.original_filename = original_filename
+        doc.status = STATUS_PENDING
+        db.commit()
+        add_alias(db, doc, user_id, user_role, original_filename)
+        return doc, True
+
+    doc = find_previous_version(db, user_id, user_role, original_filename) if revise else None
+    if doc is not None:
+        # Conditional update, so of two concurrent revisions only one can claim the document
+        claimed = db.execute(
+            update(UploadedDocument)
+            .where(UploadedDocument.id == doc.id, UploadedDocument.status != STATUS_PENDING)
+            .values(
+                sha256=sha256,
+                saved_path=saved_path,
+                size_bytes=size_bytes,
+                version=func.coalesce(UploadedDocument.version, 1) + 1,
+                status=STATUS_PENDING,
+            )
+        ).rowcount
+        db.commit()
+        if not claimed:
+            raise RevisionInProgressError(
+                f"{original_filename} is still being ingested (version {doc.version or 1}); upload the new version once it finishes"
+            )
+        db.refresh(doc)
+        add_alias(db, doc, user_id, user_role, original_filename)
+        return doc, True
+
+    candidate = file_id
+    for _ in range(FILE_ID_ATTEMPTS):
+        doc = UploadedDocument(
+            sha256=sha256,
+            file_id=candidate,
+            saved_path=saved_path,
+            original_filename=original_filename,
+            file_type=file_type,
+            size_bytes=size_bytes,
+            status=STATUS_PENDING,
+        )
+        db.add(doc)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            existing = find_by_hash(db, sha256)
+            if existing is not None:
+                # The same bytes were registered concurrently by another upload
+                add_alias(db, existing, user_id, user_role, original_filename)
+                return existing, False
+            # Different bytes already registered under this file_id (e.g. same name, same second)
+            candidate = _suffixed_file_id(file_id)
+            continue
+        add_alias(db, doc, user_id, user_role, original_filename)
+        return doc, True
+
+    raise RuntimeError(f"Could not register {original_filename}: no free file_id after {FILE_ID_ATTEMPTS} attempts")
+
+
+def fail_interrupted() -> int:
+    """
+    Marks documents left pending by a previous server process as failed. Ingestion jobs live
+    in the server process, so after a restart nothing will finish them; failed documents are
+    retried by the next upload of their bytes and can be revised again.
+    """
+    db = SessionLocal()
+    try:
+        count = db.execute(
+            update(UploadedDocument).where(UploadedDocument.status == STATUS_PENDING).values(status=STATUS_FAILED)
+        ).rowcount
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+def update_document(file_id: str, **fields):
+    """Updates a registry row from a background worker (uses its own session)."""
+    db = SessionLocal()
+    try:
+        doc = find_by_file_id(db, file_id)
+        if doc is None:
+            return None
+        for key, value in fields.items():
+            setattr(doc, key, value)
+        db.commit()
+        return doc
+    finally:
+        db.close()
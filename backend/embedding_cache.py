@@ -0,0 +1,155 @@
+# backend/embedding_cache.py
+"""
+Persistent chunk-embedding cache.
+
+Maps sha1(chunk text) -> float32 embedding, separately per embedding model.
+Vectors live in one append-only binary file per model that is read through a
+NumPy memory map; a small SQLite table maps each hash to its row. Re-ingesting
+a document, rebuilding chroma_db or ingesting a chunk that already occurs in
+another document therefore needs no model inference.
+
+Writers serialize on the SQLite write lock (BEGIN IMMEDIATE), so several
+threads or processes can share one cache directory.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(PROJECT_ROOT, "embedding_cache"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS vectors (hash TEXT PRIMARY KEY, row INTEGER NOT NULL) WITHOUT ROWID;
+"""
+
+
+def text_hash(text: str) -> str:
+    """Same hash as rag._chunk_hash, so chunk metadata and cache keys agree."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, cache_dir: str = EMBED_CACHE_DIR):
+        self.model_name = model_name
+        self.directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, "index.db")
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._dim = None
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            self._dim = int(row[0]) if row else None
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=60, isolation_level=None)
+
+    def _vectors(self, min_rows: int):
+        """Memory map covering at least min_rows rows, remapped when the file has grown."""
+        with self._lock:
+            if self._mmap is None or self._mmap.shape[0] < min_rows:
+                rows = os.path.getsize(self.vectors_path) // (4 * self._dim)
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+            return self._mmap
+
+    def _release_map(self):
+        # Readers still holding the old map keep it alive until they are done
+        with self._lock:
+            self._mmap = None
+
+    def get_many(self, hashes: list) -> dict:
+        """hash -> vector (list of floats) for every hash present in the cache."""
+        if not hashes or self._dim is None:
+            self.misses += len(hashes)
+            return {}
+        conn = self._connect()
+        try:
+            rows = {}
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows.update(conn.execute(f"SELECT hash, row FROM vectors WHERE hash IN ({placeholders})", part))
+        finally:
+            conn.close()
+        found = {}
+        if rows:
+            vectors = self._vectors(max(rows.values()) + 1)
+            found = {h: vectors[row].tolist() for h, row in rows.items()}
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, hashes: list, vectors: list):
+        """Appends vectors for hashes not cached yet."""
+        if not hashes:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if self._dim is None:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+                self._dim = int(row[0]) if row else matrix.shape[1]
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)", (str(self._dim),))
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('model', ?)", (self.model_name,))
+            if matrix.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match cache ({self._dim})")
+
+            seen = set()
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                seen.update(h for (h,) in conn.execute(f"SELECT hash FROM vectors WHERE hash IN ({placeholders})", part))
+            keep = []
+            for i, h in enumerate(hashes):
+                if h not in seen:
+                    seen.add(h)
+                    keep.append(i)
+            if not keep:
+                conn.execute("COMMIT")
+                return
+
+            # Row numbers come from the file size, which only changes under this write lock
+            row_bytes = 4 * self._dim
+            size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            first_row = size // row_bytes
+            with open(self.vectors_path, "ab") as f:
+                if size % row_bytes:
+                    # Drop a torn tail from an interrupted write. Only here: Windows refuses to
+                    # truncate a file that is memory-mapped, so release our map first.
+                    self._release_map()
+                    f.truncate(first_row * row_bytes)
+                f.write(np.ascontiguousarray(matrix[keep]).tobytes())
+            conn.executemany(
+                "INSERT INTO vectors (hash, row) VALUES (?, ?)",
+                [(hashes[i], first_row + n) for n, i in enumerate(keep)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,145 @@
+# backend/embedding_engine.py
+"""
+Batched embedding engine used by ingestion.
+
+Chunks are embedded in fixed-size batches with a configurable number of
+intra-op (PyTorch) threads. During ingestion a bounded queue sits between the
+code producing chunks and a worker thread that embeds and writes them, so
+chunking overlaps inference while memory stays bounded: producers block once
+EMBED_QUEUE_SIZE batches are waiting.
+
+With a persistent EmbeddingCache attached, chunks embedded before (by any
+document, or before chroma_db was rebuilt) are served from disk and only the
+remaining ones go through the model.
+"""
+import os
+import queue
+import threading
+import time
+
+# Chunks per forward pass
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Intra-op CPU threads for the embedding model (0 keeps the framework default)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+# Batches allowed to wait for the embedding worker before producers block
+EMBED_QUEUE_SIZE = int(os.getenv("EMBED_QUEUE_SIZE", "4"))
+
+_SENTINEL = object()
+
+
+def set_intra_op_threads(num_threads: int):
+    """Sets the PyTorch intra-op thread count (process-wide). No-op for 0 or without torch."""
+    if num_threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except Exception as e:
+        print(f"Could not set embedding threads to {num_threads}: {e}")
+
+
+class EmbeddingEngine:
+    """Wraps a LangChain Embeddings object with batching and a bounded write pipeline."""
+
+    def __init__(self, embeddings, batch_size: int = EMBED_BATCH_SIZE, num_threads: int = EMBED_THREADS,
+                 queue_size: int = EMBED_QUEUE_SIZE, cache=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.num_threads = num_threads
+        self.queue_size = max(1, queue_size)
+        set_intra_op_threads(num_threads)
+        # Make the model's own forward-pass batch match ours (HuggingFaceEmbeddings)
+        encode_kwargs = getattr(embeddings, "encode_kwargs", None)
+        if isinstance(encode_kwargs, dict):
+            encode_kwargs["batch_size"] = self.batch_size
+
+    def _embed_uncached(self, texts: list) -> list:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + self.batch_size]))
+        return vectors
+
+    def embed_documents(self, texts: list) -> list:
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        from backend.embedding_cache import text_hash
+        hashes = [text_hash(t) for t in texts]
+        found = self.cache.get_many(list(set(hashes)))
+        missing = [i for i, h in enumerate(hashes) if h not in found]
+        if missing:
+            computed = self._embed_uncached([texts[i] for i in missing])
+            self.cache.put_many([hashes[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                found[hashes[i]] = vector
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text: str) -> list:
+        return self.embeddings.embed_query(text)
+
+    def pipeline(self, sink):
+        """
+        Returns an EmbeddingPipeline whose worker calls sink(texts, vectors, payload) for every
+        submitted batch. Use as a context manager so the worker is drained and joined.
+        """
+        return EmbeddingPipeline(self, sink)
+
+
+class EmbeddingPipeline:
+    """Producer/consumer pipeline: submit() enqueues, a worker thread embeds and hands off to the sink."""
+
+    def __init__(self, engine: EmbeddingEngine, sink):
+        self.engine = engine
+        self.sink = sink
+        self.stats = {"batches": 0, "chunks": 0, "embed_seconds": 0.0, "blocked_seconds": 0.0}
+        self._queue = queue.Queue(maxsize=engine.queue_size)
+        self._error = None
+        self._worker = threading.Thread(target=self._run, name="embed-worker", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _SENTINEL:
+                return
+            if self._error is not None:
+                continue  # drain without work after a failure
+            texts, payload = item
+            try:
+                started = time.perf_counter()
+                vectors = self.engine.embed_documents(texts)
+                self.stats["embed_seconds"] += time.perf_counter() - started
+                self.sink(texts, vectors, payload)
+                self.stats["batches"] += 1
+                self.stats["chunks"] += len(texts)
+            except Exception as e:
+                self._error = e
+
+    def submit(self, texts: list, payload=None):
+        """Queues a batch; blocks while the queue is full. Raises if the worker has failed."""
+        if self._error is not None:
+            raise self._error
+        started = time.perf_counter()
+        self._queue.put((texts, payload))
+        self.stats["blocked_seconds"] += time.perf_counter() - started
+
+    def close(self):
+        """Waits for every queued batch to be embedded and written; re-raises worker errors."""
+        self._queue.put(_SENTINEL)
+        self._worker.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Stop the worker but keep the original exception
+            self._error = self._error or exc
+            self._queue.put(_SENTINEL)
+            self._worker.join()
+        return False
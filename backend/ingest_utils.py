@@ -1,6 +1,11 @@
 # backend/ingest_utils.py
 import os
 import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # PyMuPDF (fitz) is optional for PDF support; import safely
 try:
@@ -20,27 +25,110 @@ try:
 except Exception:
     Presentation = None
 
-# Pillow and pytesseract for image OCR
-try:
-    from PIL import Image
-    import pytesseract
-    
-    # Configure Tesseract path for Windows
-    # Common installation paths
-    import platform
-    if platform.system() == "Windows":
-        possible_paths = [
-            r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-            r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-            r"C:\Users\{}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe".format(os.environ.get('USERNAME', ''))
-        ]
-        for path in possible_paths:
-            if os.path.exists(path):
-                pytesseract.pytesseract.tesseract_cmd = path
-                break
-except Exception:
-    Image = None
-    pytesseract = None
+# Pillow and pytesseract for image OCR (configured in backend.ocr)
+from backend import ocr
+from backend.ocr import Image, pytesseract
+
+
+logger = logging.getLogger("backend.ingest")
+
+# File types accepted for upload and ingestion
+SUPPORTED_EXTENSIONS = {
+    '.pdf', '.docx', '.pptx', '.txt', '.md', '.csv',
+    '.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif'
+}
+
+# PDFs with at least this many pages are extracted in parallel across processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+# Process pool size for page-sharded PDF extraction (1 disables parallel mode)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Pages per shard handed to one worker process
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "32"))
+
+# max_workers -> ProcessPoolExecutor, so callers asking for a different size get their own pool
+_pdf_pools = {}
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool(workers: int):
+    with _pdf_pool_lock:
+        pool = _pdf_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            _pdf_pools[workers] = pool
+        return pool
+
+
+def _extract_pdf_page_range(path: str, start: int, end: int) -> list:
+    """Runs in a worker process: returns [(page_index, text)] for pages start..end-1."""
+    doc = fitz.open(path)
+    try:
+        return [(i, doc.load_page(i).get_text()) for i in range(start, end)]
+    finally:
+        doc.close()
+
+
+def _iter_pdf_shards(path: str, ranges: list, workers: int):
+    """Extracts page ranges on the process pool, yielding shards in order with a bounded window in flight."""
+    pool = _get_pdf_pool(workers)
+    ranges = iter(ranges)
+    window = deque()
+
+    def submit_next():
+        page_range = next(ranges, None)
+        if page_range is not None:
+            window.append(pool.submit(_extract_pdf_page_range, path, *page_range))
+
+    for _ in range(workers * 2):
+        submit_next()
+    try:
+        while window:
+            shard = window.popleft().result()
+            submit_next()
+            yield shard
+    finally:
+        # A failed shard or an abandoned iteration must not leave queued shards running
+        for future in window:
+            future.cancel()
+
+
+def iter_pdf_pages(path: str, workers: int = None, progress=None):
+    """
+    Yields (page_number, text) for every page of a PDF in page order (page_number is 1-based).
+    PDFs with at least PDF_PARALLEL_MIN_PAGES pages are sharded across a process pool of
+    `workers` processes (default PDF_EXTRACT_WORKERS); smaller ones are read in-process.
+    Textless (scanned) pages are OCR'd a shard at a time.
+    progress, if given, is called as progress(pages_done, pages_total) after each page.
+    """
+    if fitz is None:
+        raise RuntimeError("PyMuPDF (fitz) not installed. pip install pymupdf")
+
+    workers = workers or PDF_EXTRACT_WORKERS
+    with fitz.open(path) as doc:
+        total = doc.page_count
+    if total < PDF_PARALLEL_MIN_PAGES or total <= PDF_PAGES_PER_SHARD:
+        workers = 1
+
+    started = time.perf_counter()
+    ranges = [(start, min(start + PDF_PAGES_PER_SHARD, total)) for start in range(0, total, PDF_PAGES_PER_SHARD)]
+    if workers <= 1:
+        shards = (_extract_pdf_page_range(path, start, end) for start, end in ranges)
+    else:
+        shards = _iter_pdf_shards(path, ranges, workers)
+
+    done = 0
+    for shard in shards:
+        for i, text in ocr.fill_textless_pages(path, shard):
+            done += 1
+            yield i + 1, text
+            if progress:
+                progress(done, total)
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "PDF extraction %s: %d pages in %.2fs (%.1f pages/s, %d workers)",
+        os.path.basename(path), total, elapsed, total / elapsed if elapsed > 0 else 0.0, workers,
+    )
 
 
 def extract_text_from_txt(path: str) -> str:
@@ -48,14 +136,12 @@ def extract_text_from_txt(path: str) -> str:
         return f.read()
 
 
-def extract_text_from_pdf(path: str) -> str:
-    if fitz is None:
-        raise RuntimeError("PyMuPDF (fitz) not installed. pip install pymupdf")
-    doc = fitz.open(path)
-    parts = []
-    for page in doc:
-        parts.append(page.get_text())
-    return "\n".join(parts)
+def extract_text_from_pdf(path: str, progress=None) -> str:
+    """
+    Extract text from every page of a PDF (see iter_pdf_pages).
+    progress, if given, is called as progress(pages_done, pages_total) after each page.
+    """
+    return "\n".join(text for _, text in iter_pdf_pages(path, progress=progress))
 
 
 def extract_text_from_docx(path: str) -> str:
@@ -86,33 +172,26 @@ def extract_text_from_pptx(path: str) -> str:
     if Presentation is None:
         raise RuntimeError("python-pptx not installed. pip install python-pptx")
     
-    prs = Presentation(path)
-    parts = []
-    
-    for slide_num, slide in enumerate(prs.slides, 1):
-        parts.append(f"\n--- Slide {slide_num} ---")
-        for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text.strip():
-                parts.append(shape.text)
-    
-    return "\n".join(parts)
+    return "\n".join(text for _, text in _iter_pptx_slides(path))
 
 
 def extract_text_from_image(path: str) -> str:
-    """Extract text from images using OCR (Tesseract)."""
+    """Extract text from images using OCR (Tesseract). Every frame of multi-frame images is read."""
     if Image is None or pytesseract is None:
         raise RuntimeError("Pillow and pytesseract not installed. pip install Pillow pytesseract")
     
     try:
-        img = Image.open(path)
-        text = pytesseract.image_to_string(img)
-        return text
+        return ocr.ocr_image_file(path)
     except Exception as e:
         print(f"OCR error for {path}: {e}")
         return f"[Image file - OCR failed: {str(e)}]"
 
 
-def extract_text(path: str) -> str:
+def extract_text(path: str, progress=None) -> str:
+    """
+    Extract text from any supported file type.
+    progress, if given, is called as progress(pages_done, pages_total) for paged formats.
+    """
     ext = os.path.splitext(path)[1].lower()
     
     # Text-based formats
@@ -121,7 +200,7 @@ def extract_text(path: str) -> str:
     
     # PDF
     if ext in [".pdf"]:
-        return extract_text_from_pdf(path)
+        return extract_text_from_pdf(path, progress=progress)
     
     # DOCX
     if ext in [".docx"]:
@@ -142,6 +221,58 @@ def extract_text(path: str) -> str:
         return f"[Unsupported file format: {ext}]"
 
 
+# Size of the blocks plain-text files are streamed in by iter_text_pages
+TEXT_BLOCK_CHARS = int(os.getenv("TEXT_BLOCK_CHARS", "65536"))
+
+
+def _iter_txt_blocks(path: str):
+    # Blocks end on line boundaries (newline dropped) so "\n".join(blocks) restores the text
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        block_num, lines, size = 1, [], 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= TEXT_BLOCK_CHARS:
+                yield block_num, "".join(lines)[:-1] if line.endswith("\n") else "".join(lines)
+                block_num, lines, size = block_num + 1, [], 0
+        if lines:
+            yield block_num, "".join(lines)
+
+
+def _iter_pptx_slides(path: str):
+    if Presentation is None:
+        raise RuntimeError("python-pptx not installed. pip install python-pptx")
+    prs = Presentation(path)
+    for slide_num, slide in enumerate(prs.slides, 1):
+        parts = [f"\n--- Slide {slide_num} ---"]
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text.strip():
+                parts.append(shape.text)
+        yield slide_num, "\n".join(parts)
+
+
+def iter_text_pages(path: str, progress=None):
+    """
+    Streaming counterpart of extract_text: yields (page_number, text) one page at a time
+    (PDF pages, PPTX slides, fixed-size blocks of plain text) so callers never hold the
+    whole document in memory. Formats without a natural page structure yield a single page.
+    progress, if given, is called as progress(pages_done, pages_total) for PDFs.
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".pdf":
+        yield from iter_pdf_pages(path, progress=progress)
+    elif ext == ".pptx":
+        yield from _iter_pptx_slides(path)
+    elif ext in [".docx", ".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".gif"]:
+        yield 1, extract_text(path)
+    else:
+        try:
+            yield from _iter_txt_blocks(path)
+        except Exception:
+            yield 1, f"[Unsupported file format: {ext}]"
+
+
 def save_preview(content_text: str, original_path: str, preview_dir: str = None, chars: int = 2000):
     """
     Saves a small preview JSON for quick inspection.
@@ -0,0 +1,172 @@
+# backend/jobs.py
+"""
+In-process background job queue for document ingestion.
+
+Uploads are saved to disk by the request handler and the expensive part
+(text extraction, OCR, embedding, vector store writes) is handed to a
+bounded thread pool so the event loop is never blocked. Each job keeps its
+stage, progress counters and timings so clients can poll it.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of ingestion jobs that may run at the same time
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Maximum number of jobs waiting for a worker before new uploads are rejected
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "100"))
+# Finished jobs kept in memory for status polling
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "500"))
+
+STAGE_QUEUED = "queued"
+STAGE_EXTRACTING = "extracting"
+STAGE_EMBEDDING = "embedding"
+STAGE_STREAMING = "streaming"  # extraction and embedding interleaved (large files)
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+FINISHED_STAGES = {STAGE_DONE, STAGE_FAILED}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many jobs are already waiting for a worker."""
+
+
+class IngestionJob:
+    """
+    State of a single background ingestion job.
+    All mutation goes through the helper methods so readers always see a consistent snapshot.
+    """
+
+    def __init__(self, filename: str, meta: dict = None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.meta = dict(meta or {})
+        self.stage = STAGE_QUEUED
+        self.progress = {
+            "pages_done": 0,
+            "pages_total": None,
+            "chunks_embedded": 0,
+            "chunks_total": None,
+        }
+        self.timings = {"queued_at": time.time(), "started_at": None, "finished_at": None}
+        self.stage_durations = {}
+        self.result = {}
+        self.error = None
+        self._stage_started = None
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str):
+        with self._lock:
+            now = time.time()
+            if self._stage_started is not None and self.stage not in FINISHED_STAGES:
+                self.stage_durations[self.stage] = round(now - self._stage_started, 3)
+            if self.timings["started_at"] is None and stage != STAGE_QUEUED:
+                self.timings["started_at"] = now
+            if stage in FINISHED_STAGES:
+                self.timings["finished_at"] = now
+            self.stage = stage
+            self._stage_started = now
+
+    def update_progress(self, **counters):
+        with self._lock:
+            self.progress.update(counters)
+
+    def page_progress(self, done: int, total: int):
+        """Callback signature used by the extractors."""
+        self.update_progress(pages_done=done, pages_total=total)
+
+    def chunk_progress(self, done: int, total: int):
+        """Callback signature used by rag.ingest_document."""
+        self.update_progress(chunks_embedded=done, chunks_total=total)
+
+    def finish(self, result: dict = None):
+        with self._lock:
+            self.result.update(result or {})
+        self.set_stage(STAGE_DONE)
+
+    def fail(self, error: str):
+        with self._lock:
+            self.error = error
+        self.set_stage(STAGE_FAILED)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            started = self.timings["started_at"]
+            finished = self.timings["finished_at"]
+            queued = self.timings["queued_at"]
+            return {
+                "job_id": self.id,
+                "filename": self.filename,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "timings": {
+                    "queued_at": queued,
+                    "started_at": started,
+                    "finished_at": finished,
+                    "wait_seconds": round((started or time.time()) - queued, 3),
+                    "run_seconds": round((finished or time.time()) - started, 3) if started else None,
+                    "stages": dict(self.stage_durations),
+                },
+                "result": dict(self.result),
+                "error": self.error,
+                **self.meta,
+            }
+
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_pending = 0
+
+
+def _prune_history():
+    # Caller holds _jobs_lock. Drop the oldest finished jobs beyond the history limit.
+    finished = [job_id for job_id, job in _jobs.items() if job.stage in FINISHED_STAGES]
+    for job_id in finished[:max(0, len(finished) - JOB_HISTORY_LIMIT)]:
+        del _jobs[job_id]
+
+
+def submit_job(job: IngestionJob, fn, *args, **kwargs) -> IngestionJob:
+    """
+    Registers the job and schedules fn(job, *args, **kwargs) on the worker pool.
+    fn is responsible for moving the job through its stages; any exception it
+    raises marks the job as failed.
+    """
+    global _pending
+
+    with _jobs_lock:
+        if _pending >= INGEST_MAX_PENDING:
+            raise QueueFullError(f"Ingestion queue is full ({_pending} jobs pending)")
+        _pending += 1
+        _jobs[job.id] = job
+        _prune_history()
+
+    def _run():
+        global _pending
+        with _jobs_lock:
+            _pending -= 1
+        try:
+            fn(job, *args, **kwargs)
+            if job.stage not in FINISHED_STAGES:
+                job.finish()
+        except Exception as e:
+            print(f"Ingestion job {job.id} failed: {e}")
+            job.fail(str(e))
+
+    _executor.submit(_run)
+    return job
+
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def queue_stats() -> dict:
+    with _jobs_lock:
+        running = sum(1 for job in _jobs.values() if job.stage not in FINISHED_STAGES and job.stage != STAGE_QUEUED)
+        return {"workers": INGEST_WORKERS, "pending": _pending, "running": running, "tracked_jobs": len(_jobs)}
@@ -0,0 +1,126 @@
+# backend/keyword_index.py
+"""
+BM25 keyword index over ingested chunks (SQLite FTS5).
+
+Dense MiniLM retrieval misses exact-term queries: formula names, chapter
+numbers, identifiers. This index is written alongside the vector store at
+ingest time (same chunk ids) and searched with FTS5's built-in bm25() ranking;
+rag fuses both rankings with reciprocal rank fusion.
+"""
+import os
+import re
+import sqlite3
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", os.path.join(PROJECT_ROOT, "keyword_index.db"))
+# Query terms beyond this are ignored (keeps MATCH expressions cheap for pasted paragraphs)
+MAX_QUERY_TERMS = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_map (
+    rowid INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_chunk_map_source ON chunk_map (source);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(text, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_local = threading.local()
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def _connect():
+    """One connection per thread, reused across calls (FTS queries are too cheap to pay for connects)."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(KEYWORD_INDEX_PATH, timeout=60, isolation_level=None)
+        with _init_lock:
+            if not _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _initialized = True
+        _local.conn = conn
+    return conn
+
+
+def to_match_query(query: str):
+    """Turns free text into an FTS5 MATCH expression: every term quoted, OR-ed. None if no terms."""
+    terms = []
+    for term in _TERM_RE.findall(query or ""):
+        term = term.lower()
+        if term not in terms:
+            terms.append(term)
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms[:MAX_QUERY_TERMS])
+
+
+def add(ids: list, texts: list, sources: list):
+    if not ids:
+        return
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _delete_ids(conn, ids)
+        for chunk_id, text, source in zip(ids, texts, sources):
+            cursor = conn.execute("INSERT INTO chunk_map (chunk_id, source) VALUES (?, ?)", (chunk_id, source))
+            conn.execute("INSERT INTO chunk_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _delete_ids(conn, ids: list):
+    for start in range(0, len(ids), 500):
+        part = ids[start:start + 500]
+        placeholders = ",".join("?" * len(part))
+        rowids = [(r,) for (r,) in conn.execute(f"SELECT rowid FROM chunk_map WHERE chunk_id IN ({placeholders})", part)]
+        if rowids:
+            conn.executemany("DELETE FROM chunk_fts WHERE rowid = ?", rowids)
+            conn.executemany("DELETE FROM chunk_map WHERE rowid = ?", rowids)
+
+
+def delete(ids: list):
+    if not ids:
+        return
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _delete_ids(conn, ids)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def count() -> int:
+    return _connect().execute("SELECT COUNT(*) FROM chunk_map").fetchone()[0]
+
+
+def search(query: str, k: int = 10, source: str = None) -> list:
+    """Chunk ids ranked by BM25 (best first), optionally restricted to one source."""
+    match = to_match_query(query)
+    if match is None:
+        return []
+    sql = (
+        "SELECT m.chunk_id FROM chunk_fts JOIN chunk_map m ON m.rowid = chunk_fts.rowid "
+        "WHERE chunk_fts MATCH ?"
+    )
+    params = [match]
+    if source is not None:
+        sql += " AND m.source = ?"
+        params.append(source)
+    sql += " ORDER BY bm25(chunk_fts) LIMIT ?"
+    params.append(k)
+    try:
+        return [chunk_id for (chunk_id,) in _connect().execute(sql, params)]
+    except sqlite3.OperationalError as e:
+        print(f"Keyword search error: {e}")
+        return []
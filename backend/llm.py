@@ -0,0 +1,150 @@
+# backend/llm.py
+"""
+Shared LLM clients and prompt chains.
+
+Every prompt used by the routers and the summarizers is registered here once
+(at import time of the module that owns it) and compiled into a
+prompt | model | parser chain once, at startup (warm_up) or on first use.
+All chains share one ChatGroq client per temperature, and all clients share
+one sync and one async HTTP connection pool, so requests reuse keep-alive
+connections and TLS sessions instead of building a client per call.
+
+Async endpoints should use `await chain.ainvoke(...)`, which goes through the
+async pool and does not block the event loop; worker threads use `invoke`.
+"""
+import os
+import threading
+
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+# Connection pool shared by all LLM calls of the process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "120"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+_lock = threading.Lock()
+_http_clients = None
+# (model, temperature) -> ChatGroq
+_models = {}
+# name -> PromptChain
+_chains = {}
+
+
+def _get_http_clients():
+    """(httpx.Client, httpx.AsyncClient) shared by every ChatGroq instance."""
+    global _http_clients
+    if _http_clients is None:
+        with _lock:
+            if _http_clients is None:
+                import httpx
+                limits = httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+                )
+                timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+                _http_clients = (
+                    httpx.Client(limits=limits, timeout=timeout),
+                    httpx.AsyncClient(limits=limits, timeout=timeout),
+                )
+    return _http_clients
+
+
+def get_chat_model(temperature: float, model: str = None):
+    """The process-wide ChatGroq client for (model, temperature)."""
+    key = (model or LLM_MODEL, float(temperature))
+    llm = _models.get(key)
+    if llm is not None:
+        return llm
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("GROQ_API_KEY not set")
+    http_client, http_async_client = _get_http_clients()
+    with _lock:
+        llm = _models.get(key)
+        if llm is None:
+            from langchain_groq import ChatGroq
+            llm = ChatGroq(
+                model=key[0],
+                temperature=key[1],
+                api_key=api_key,
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+            _models[key] = llm
+    return llm
+
+
+class PromptChain:
+    """A registered prompt, compiled into prompt | model | StrOutputParser once."""
+
+    def __init__(self, name: str, template: str, temperature: float, model: str = None):
+        self.name = name
+        self.template = template
+        self.temperature = temperature
+        self.model = model
+        self._chain = None
+
+    def compile(self):
+        if self._chain is None:
+            from langchain_core.prompts import ChatPromptTemplate
+            from langchain_core.output_parsers import StrOutputParser
+            llm = get_chat_model(self.temperature, self.model)
+            chain = ChatPromptTemplate.from_template(self.template) | llm | StrOutputParser()
+            with _lock:
+                if self._chain is None:
+                    self._chain = chain
+        return self._chain
+
+    @property
+    def compiled(self) -> bool:
+        return self._chain is not None
+
+    def invoke(self, inputs: dict) -> str:
+        return self.compile().invoke(inputs)
+
+    async def ainvoke(self, inputs: dict) -> str:
+        return await self.compile().ainvoke(inputs)
+
+
+def register_chain(name: str, template: str, temperature: float = 0.3, model: str = None) -> PromptChain:
+    """Registers a prompt under a unique name. Cheap: nothing is imported or compiled until used."""
+    with _lock:
+        existing = _chains.get(name)
+        if existing is not None:
+            if existing.template != template or existing.temperature != temperature or existing.model != model:
+                raise ValueError(f"Prompt chain {name!r} is already registered with a different prompt")
+            return existing
+        chain = PromptChain(name, template, temperature, model)
+        _chains[name] = chain
+        return chain
+
+
+def warm_up():
+    """Compiles every registered chain. Skipped (chains compile lazily) when no API key is set."""
+    if not os.getenv("GROQ_API_KEY"):
+        print("GROQ_API_KEY not set; LLM chains will be compiled on first use")
+        return 0
+    compiled = 0
+    for chain in list(_chains.values()):
+        try:
+            chain.compile()
+            compiled += 1
+        except Exception as e:
+            print(f"Failed to compile prompt chain {chain.name}: {e}")
+    return compiled
+
+
+def stats() -> dict:
+    chains = list(_chains.values())
+    return {
+        "model": LLM_MODEL,
+        "chains_registered": len(chains),
+        "chains_compiled": sum(1 for c in chains if c.compiled),
+        "clients": len(_models),
+        "max_connections": LLM_MAX_CONNECTIONS,
+    }
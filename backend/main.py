@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 
 from backend.models import create_tables, get_engine
+from backend import documents, llm, rag
 
 # Routers
 from backend.routers.auth import router as auth_router
@@ -24,6 +25,15 @@ def startup_event():
     ENGINE = get_engine()
     create_tables(ENGINE)
     logger.info("DB initialized")
+    # Jobs of the previous process are gone; their documents would otherwise stay pending for good
+    interrupted = documents.fail_interrupted()
+    if interrupted:
+        logger.info("Marked %d interrupted ingestions as failed", interrupted)
+    # Build the shared LLM clients and compile every registered prompt chain once
+    logger.info("Compiled %d LLM prompt chains", llm.warm_up())
+    # Load the embedding model / vector store in the background so startup and /health stay instant
+    if os.getenv("RAG_WARMUP", "true").lower() == "true":
+        rag.start_warm_up()
 
 # CORS
 app.add_middleware(
@@ -41,7 +51,16 @@ app.add_middleware(
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "rag": rag.readiness(), "query_embedding": rag.query_embedding_metrics(),
+            "query_cache": rag.query_cache_metrics(), "embedding_cache": rag.embedding_cache_metrics(),
+            "llm": llm.stats()}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 503 until the embedding model and vector store are loaded."""
+    from fastapi.responses import JSONResponse
+    state = rag.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
 
 # Add existing routers
 app.include_router(auth_router)
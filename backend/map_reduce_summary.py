@@ -0,0 +1,171 @@
+# backend/map_reduce_summary.py
+"""
+Hierarchical (map-reduce) summarization of long documents.
+
+The document's chunks are grouped into sections, every section is summarized
+into study notes concurrently (at most SUMMARY_MAP_WORKERS LLM calls in
+flight), and the notes are reduced into the usual topic / summary_paragraphs /
+key_points JSON by the regular single-pass summarizer. If the notes are still
+over the reduce budget they are grouped and summarized again.
+
+Section boundaries are content-defined: a section ends after a chunk whose hash
+falls on a boundary (once the section has its minimum size), so an edit only
+changes the sections around it. Section notes are cached on disk by a hash of
+the section text, the prompt version and the model, so re-summarizing an
+edited document only calls the LLM for the sections that changed.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import llm
+from backend.context_selection import join_without_overlap
+from backend.tokenization import count_tokens
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECTION_CACHE_PATH = os.getenv("SECTION_CACHE_PATH", os.path.join(PROJECT_ROOT, "section_summaries.db"))
+# Concurrent section summaries against the LLM
+SUMMARY_MAP_WORKERS = int(os.getenv("SUMMARY_MAP_WORKERS", "4"))
+# Section size bounds in tokens; between them, boundaries are content-defined
+SECTION_MIN_TOKENS = int(os.getenv("SECTION_MIN_TOKENS", "1500"))
+SECTION_MAX_TOKENS = int(os.getenv("SECTION_MAX_TOKENS", "4000"))
+# A chunk ends a section when its hash is divisible by this (about one boundary per N chunks)
+SECTION_BOUNDARY_DIVISOR = 8
+# Reduce levels before the notes are truncated into the final call instead of summarized again
+SUMMARY_MAX_LEVELS = int(os.getenv("SUMMARY_MAX_LEVELS", "3"))
+# Bump when the section prompt changes so cached notes are not reused
+SECTION_PROMPT_VERSION = "1"
+
+SECTION_PROMPT = """
+SYSTEM: You are an expert AI Tutor taking study notes on one section of a longer document.
+Write concise notes (120-200 words) covering the key concepts, definitions, formulas and
+examples of this section, as short plain-text bullet points starting with "- ".
+Use only facts present in the section. Do not mention that this is a section or a summary.
+
+<<<SECTION>>>
+{text}
+<<<SECTION>>>
+"""
+SECTION_CHAIN = llm.register_chain("summary_section", SECTION_PROMPT, temperature=0.2)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS section_summaries (
+    key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(SECTION_CACHE_PATH, timeout=30)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def _section_key(text: str) -> str:
+    h = hashlib.sha256(text.encode("utf-8"))
+    h.update(f"|{llm.LLM_MODEL}|{SECTION_PROMPT_VERSION}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _cache_get(key: str):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT summary FROM section_summaries WHERE key = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def _cache_put(key: str, summary: str):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO section_summaries (key, summary, created_at) VALUES (?, ?, ?)",
+            (key, summary, time.time()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def split_sections(chunks: list) -> list:
+    """Groups consecutive chunks into sections with content-defined boundaries. Returns section texts."""
+    sections, current, tokens = [], None, 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        current = chunk if current is None else join_without_overlap(current, chunk)
+        tokens += count_tokens(chunk)
+        boundary = int(hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:8], 16) % SECTION_BOUNDARY_DIVISOR == 0
+        if tokens >= SECTION_MAX_TOKENS or (tokens >= SECTION_MIN_TOKENS and boundary):
+            sections.append(current)
+            current, tokens = None, 0
+    if current is not None:
+        sections.append(current)
+    return sections
+
+
+def _summarize_section(text: str) -> str:
+    key = _section_key(text)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    summary = SECTION_CHAIN.invoke({"text": text}).strip()
+    _cache_put(key, summary)
+    return summary
+
+
+def summarize_sections(sections: list) -> list:
+    """Notes for every section, None where the LLM call failed."""
+    if not os.getenv("GROQ_API_KEY"):
+        raise RuntimeError("GROQ_API_KEY not set")
+
+    def run(text):
+        try:
+            return _summarize_section(text)
+        except Exception as e:
+            print(f"Section summary error: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_MAP_WORKERS)) as pool:
+        return list(pool.map(run, sections))
+
+
+def summarize_chunks(chunks: list, reduce_fn, reduce_tokens: int, max_length: int = 500):
+    """
+    Map-reduce summary of an ordered list of chunk texts.
+    reduce_fn(text, max_length) produces the final JSON summary (rag.summarize_text).
+    Raises if any section could not be summarized, so a summary missing part of the
+    document is never returned (and stored) as if it were complete; the notes of the
+    sections that did succeed are cached, so a retry only redoes the failed ones.
+    """
+    started = time.perf_counter()
+    sections = split_sections(chunks)
+    levels = 0
+    while True:
+        levels += 1
+        notes = summarize_sections(sections)
+        failed = sum(1 for n in notes if not n)
+        if failed:
+            raise RuntimeError(f"{failed} of {len(notes)} section summaries failed")
+        combined = "\n\n".join(notes)
+        if count_tokens(combined) <= reduce_tokens or len(notes) == 1:
+            break
+        if levels >= SUMMARY_MAX_LEVELS:
+            # Levels are not guaranteed to shrink the notes; the reduce call truncates the rest
+            print(f"Map-reduce summary: notes still over budget after {levels} levels")
+            break
+        # Still too long for one reduce call: summarize the notes themselves
+        sections = split_sections(notes)
+    print(f"Map-reduce summary: {len(chunks)} chunks, {levels} level(s), {time.perf_counter() - started:.1f}s")
+    return reduce_fn(combined, max_length)
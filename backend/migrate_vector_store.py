@@ -0,0 +1,129 @@
+# backend/migrate_vector_store.py
+"""
+Moves the chunk collection between vector stores (VECTOR_STORE=chroma / numpy).
+
+Switching VECTOR_STORE opens an empty store, and the document registry will not
+re-ingest files it already knows, so existing documents have to be carried
+over explicitly:
+
+  * copy (default): reads every chunk with its stored embedding, text and
+    metadata from the other store and adds it to the target. No model
+    inference; chunk ids stay the same, so chunk manifests and the keyword
+    index remain valid.
+  * --from-text-store: re-chunks and re-embeds every registered document from
+    the extracted-text store into the store selected by VECTOR_STORE, for when
+    the old store is gone. Uses the embedding cache, so it is cheap if the
+    chunks were embedded before.
+
+Both modes skip chunks/documents already in the target and can be re-run.
+
+Usage:
+    python -m backend.migrate_vector_store --to numpy
+    python -m backend.migrate_vector_store --to chroma
+    VECTOR_STORE=numpy python -m backend.migrate_vector_store --from-text-store
+"""
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+# Chunks read from the source store per batch
+MIGRATE_BATCH_SIZE = 1000
+
+
+def open_store(kind: str):
+    """The raw collection of a store, without loading the embedding model."""
+    if kind == "numpy":
+        from backend.vector_index import VectorIndex
+        return VectorIndex()
+    if kind == "chroma":
+        import chromadb
+        from backend.rag import CHROMA_DB_DIR, COLLECTION_NAME
+        client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+        return client.get_or_create_collection(COLLECTION_NAME)
+    raise ValueError(f"Unknown vector store: {kind!r} (expected 'chroma' or 'numpy')")
+
+
+def copy_chunks(source, target, batch_size: int = MIGRATE_BATCH_SIZE) -> dict:
+    """Copies every chunk (embedding, text, metadata) from source to target, skipping ids already there."""
+    copied = skipped = offset = 0
+    while True:
+        batch = source.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        ids = batch["ids"]
+        if not ids:
+            break
+        offset += len(ids)
+        present = set(target.get(ids=ids, include=[])["ids"])
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in present]
+        skipped += len(ids) - len(keep)
+        if keep:
+            target.add(
+                ids=[ids[i] for i in keep],
+                embeddings=[list(map(float, batch["embeddings"][i])) for i in keep],
+                documents=[batch["documents"][i] for i in keep],
+                metadatas=[batch["metadatas"][i] for i in keep],
+            )
+            copied += len(keep)
+        print(f"  {offset} chunks read, {copied} copied, {skipped} already present")
+    return {"copied": copied, "skipped": skipped}
+
+
+def reindex_from_text_store() -> dict:
+    """Re-ingests every registered document that has stored text but no chunks in the current store."""
+    from backend import documents, rag, text_store
+    from backend.models import UploadedDocument
+
+    db = documents.SessionLocal()
+    try:
+        docs = [
+            (d.file_id, d.sha256, d.version or 1)
+            for d in db.query(UploadedDocument).filter(UploadedDocument.status == documents.STATUS_INGESTED)
+        ]
+    finally:
+        db.close()
+
+    collection = rag.get_collection()
+    stats = {"reindexed": 0, "present": 0, "missing_text": 0}
+    for n, (file_id, sha256, version) in enumerate(docs, 1):
+        if collection.get(where={"source": file_id}, limit=1, include=[])["ids"]:
+            stats["present"] += 1
+            continue
+        pages = list(text_store.iter_pages(sha256)) if text_store.has_document(sha256) else []
+        if not any(text for _, text in pages):
+            stats["missing_text"] += 1
+            print(f"[{n}/{len(docs)}] no stored text for {file_id}; re-upload it")
+            continue
+        result = rag.ingest_pages(file_id, pages, version=version)
+        stats["reindexed"] += 1
+        print(f"[{n}/{len(docs)}] {file_id}: {result['chunks_total']} chunks")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move the chunk collection between vector stores.")
+    parser.add_argument("--to", choices=["numpy", "chroma"], help="Target store; chunks are copied from the other one")
+    parser.add_argument("--from-text-store", action="store_true",
+                        help="Re-ingest registered documents from the text store into VECTOR_STORE instead of copying")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.from_text_store:
+        from backend import rag
+        print(f"Re-indexing documents from the text store into {rag.VECTOR_STORE}")
+        stats = reindex_from_text_store()
+    elif args.to:
+        source_kind = "chroma" if args.to == "numpy" else "numpy"
+        source, target = open_store(source_kind), open_store(args.to)
+        print(f"Copying {source.count()} chunks from {source_kind} to {args.to}")
+        stats = copy_chunks(source, target)
+        print(f"Set VECTOR_STORE={args.to} to serve from the new store.")
+    else:
+        parser.error("pass --to numpy|chroma or --from-text-store")
+    print(f"Done in {time.perf_counter() - started:.1f}s: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy import create_engine
 import os
@@ -64,6 +64,56 @@ class QuizQuestion(BASE):
     user_answer = Column(Text, nullable=True)
     is_correct = Column(Boolean, default=False)
 
+# Content-addressed registry: one row per distinct file (SHA-256 of its bytes)
+class UploadedDocument(BASE):
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False, index=True)
+    file_id = Column(String(512), unique=True, nullable=False, index=True)  # 'source' key in the vector store
+    original_filename = Column(String(512), nullable=False)
+    saved_path = Column(Text, nullable=False)
+    file_type = Column(String(16), nullable=True)
+    size_bytes = Column(Integer, default=0)
+    version = Column(Integer, default=1)  # bumped every time a revised file replaces the content
+    status = Column(String(32), default="pending")  # 'pending', 'ingested', 'empty', 'failed'
+    job_id = Column(String(64), nullable=True)
+    text_length = Column(Integer, default=0)
+    chunk_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    aliases = relationship("DocumentAlias", backref="document", cascade="all, delete-orphan")
+
+# Every upload of a registered document, including duplicates, by owner and filename
+class DocumentAlias(BASE):
+    __tablename__ = "document_aliases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    user_id = Column(String(256), nullable=False, index=True)
+    user_role = Column(String(32), nullable=False)
+    original_filename = Column(String(512), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Generated document summaries, one per (file_id, document version, prompt version, mode)
+class ContentSummary(BASE):
+    __tablename__ = "content_summaries"
+    __table_args__ = (
+        UniqueConstraint("file_id", "version", "prompt_version", "mode", name="uq_content_summary_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(String(512), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    prompt_version = Column(String(32), nullable=False)
+    mode = Column(String(32), nullable=False)  # 'sample' or 'map_reduce'
+    max_length = Column(Integer, nullable=False)  # length requested when generated; not part of the key
+    topic = Column(Text, nullable=True)
+    summary_json = Column(Text, nullable=False)
+    generation_seconds = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 def get_engine(db_path: str | None = None):
     if db_path is None:
         current_dir = os.path.dirname(__file__)
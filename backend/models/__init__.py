@@ -18,7 +18,10 @@ Message = models_module.Message
 HomeworkSession = models_module.HomeworkSession
 QuizAttempt = models_module.QuizAttempt
 QuizQuestion = models_module.QuizQuestion
+UploadedDocument = models_module.UploadedDocument
+DocumentAlias = models_module.DocumentAlias
+ContentSummary = models_module.ContentSummary
 get_engine = models_module.get_engine
 create_tables = models_module.create_tables
 
-__all__ = ['BASE', 'User', 'Message', 'HomeworkSession', 'QuizAttempt', 'QuizQuestion', 'get_engine', 'create_tables']
+__all__ = ['BASE', 'User', 'Message', 'HomeworkSession', 'QuizAttempt', 'QuizQuestion', 'UploadedDocument', 'DocumentAlias', 'ContentSummary', 'get_engine', 'create_tables']
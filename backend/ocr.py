@@ -0,0 +1,208 @@
+# backend/ocr.py
+"""
+OCR engine for image uploads and scanned PDF pages.
+
+Every frame of a multi-frame image and every textless PDF page is OCR'd.
+Tesseract calls run in a process pool after a light preprocessing step
+(grayscale, downscale to OCR_TARGET_DPI), and results are cached on disk
+by a hash of the image bytes so identical images are never OCR'd twice.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+# Pillow and pytesseract for image OCR
+try:
+    from PIL import Image, ImageSequence
+    import pytesseract
+
+    # Configure Tesseract path for Windows
+    # Common installation paths
+    import platform
+    if platform.system() == "Windows":
+        possible_paths = [
+            r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+            r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+            r"C:\Users\{}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe".format(os.environ.get('USERNAME', ''))
+        ]
+        for path in possible_paths:
+            if os.path.exists(path):
+                pytesseract.pytesseract.tesseract_cmd = path
+                break
+except Exception:
+    Image = None
+    ImageSequence = None
+    pytesseract = None
+
+logger = logging.getLogger("backend.ocr")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(PROJECT_ROOT, "ocr_cache"))
+# Process pool size for Tesseract calls
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Images are downscaled to (and PDF pages rendered at) this resolution before OCR
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+# Fallback cap on the long side for images without DPI information
+OCR_MAX_SIDE_PX = int(os.getenv("OCR_MAX_SIDE_PX", "3500"))
+# PDF pages with fewer extracted characters than this are treated as scanned
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "10"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def is_available() -> bool:
+    return Image is not None and pytesseract is not None
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+        return _pool
+
+
+def _preprocess(img):
+    """Grayscale and downscale to OCR_TARGET_DPI (or OCR_MAX_SIDE_PX when the DPI is unknown)."""
+    img = img.convert("L")
+    dpi = img.info.get("dpi")
+    if dpi and dpi[0]:
+        scale = min(1.0, OCR_TARGET_DPI / float(dpi[0]))
+    else:
+        scale = min(1.0, OCR_MAX_SIDE_PX / float(max(img.size)))
+    if scale < 1.0:
+        img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+    return img
+
+
+def _tesseract(png_bytes: bytes, lang: str) -> str:
+    """Runs in a worker process."""
+    img = Image.open(io.BytesIO(png_bytes))
+    return pytesseract.image_to_string(_preprocess(img), lang=lang)
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, key[:2], f"{key}.txt")
+
+
+def _cache_key(image_bytes: bytes) -> str:
+    h = hashlib.sha256(image_bytes)
+    h.update(f"|{OCR_LANG}|{OCR_TARGET_DPI}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _cache_get(key: str):
+    path = _cache_path(key)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+
+def _cache_put(key: str, text: str):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def ocr_images(images: list) -> list:
+    """
+    OCR a list of PNG-encoded images, returning their texts in the same order.
+    Cached results are returned directly; the rest are fanned out across the process pool.
+    """
+    if not is_available():
+        raise RuntimeError("Pillow and pytesseract not installed. pip install Pillow pytesseract")
+
+    texts = [None] * len(images)
+    pending = {}
+    for i, png_bytes in enumerate(images):
+        key = _cache_key(png_bytes)
+        cached = _cache_get(key)
+        if cached is not None:
+            texts[i] = cached
+        else:
+            pending[i] = key
+
+    if pending:
+        pool = _get_pool()
+        futures = {i: pool.submit(_tesseract, images[i], OCR_LANG) for i in pending}
+        for i, future in futures.items():
+            texts[i] = future.result()
+            _cache_put(pending[i], texts[i])
+
+    logger.info("OCR: %d images, %d from cache", len(images), len(images) - len(pending))
+    return texts
+
+
+def _to_png(img, dpi=None) -> bytes:
+    buf = io.BytesIO()
+    if dpi:
+        img.save(buf, format="PNG", dpi=dpi)
+    else:
+        img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def ocr_image_file(path: str) -> str:
+    """OCR every frame of an image file (multi-frame TIFF/GIF included)."""
+    if not is_available():
+        raise RuntimeError("Pillow and pytesseract not installed. pip install Pillow pytesseract")
+
+    with Image.open(path) as img:
+        dpi = img.info.get("dpi")
+        frames = []
+        for frame in ImageSequence.Iterator(img):
+            frames.append(_to_png(frame.convert("RGB"), dpi=dpi))
+
+    texts = ocr_images(frames)
+    if len(texts) == 1:
+        return texts[0]
+    return "\n".join(f"--- Frame {i} ---\n{t}" for i, t in enumerate(texts, 1))
+
+
+def ocr_pdf_pages(path: str, page_indexes: list) -> dict:
+    """
+    Render the given (0-based) PDF pages at OCR_TARGET_DPI and OCR them.
+    Returns {page_index: text}.
+    """
+    if fitz is None:
+        raise RuntimeError("PyMuPDF (fitz) not installed. pip install pymupdf")
+    if not page_indexes:
+        return {}
+
+    images = []
+    with fitz.open(path) as doc:
+        for i in page_indexes:
+            pix = doc.load_page(i).get_pixmap(dpi=OCR_TARGET_DPI, colorspace=fitz.csGRAY)
+            images.append(pix.tobytes("png"))
+    return dict(zip(page_indexes, ocr_images(images)))
+
+
+def fill_textless_pages(path: str, pages: list) -> list:
+    """
+    Given [(page_index, text)] for a PDF, replace the text of pages that have no text
+    layer with their OCR output. Returns the list in the same order. No-op when OCR
+    is not installed.
+    """
+    missing = [i for i, text in pages if len((text or "").strip()) < OCR_MIN_PAGE_CHARS]
+    if not missing or not is_available():
+        return pages
+    try:
+        ocr_texts = ocr_pdf_pages(path, missing)
+    except Exception as e:
+        print(f"OCR error for {path}: {e}")
+        return pages
+    return [(i, ocr_texts.get(i, text)) for i, text in pages]
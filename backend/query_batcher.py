@@ -0,0 +1,124 @@
+# backend/query_batcher.py
+"""
+Dynamic micro-batching of query embeddings.
+
+Concurrent retrieval requests each need one short query embedded. Instead of
+running one MiniLM forward pass per request, callers hand their query to a
+shared batcher; a worker thread waits up to QUERY_BATCH_MAX_WAIT_MS for more
+queries to arrive (or until QUERY_BATCH_MAX_SIZE are queued) and embeds them
+all in a single embed_documents call.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Longest a query waits for companions before its batch is run
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "5"))
+# Queries per forward pass
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+# Upper bounds of the batch-size histogram buckets
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class QueryEmbeddingBatcher:
+    """Collects concurrent embed() calls and embeds them in batches on a worker thread."""
+
+    def __init__(self, embed_batch, max_batch: int = QUERY_BATCH_MAX_SIZE, max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS):
+        """embed_batch: callable taking a list of strings and returning a list of vectors."""
+        self.embed_batch = embed_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "queries": 0,
+            "batches": 0,
+            "errors": 0,
+            "max_batch_size": 0,
+            "queue_seconds_total": 0.0,
+            "queue_seconds_max": 0.0,
+            "embed_seconds_total": 0.0,
+            "batch_size_histogram": {str(b): 0 for b in _SIZE_BUCKETS + ("inf",)},
+        }
+        self._worker = threading.Thread(target=self._run, name="query-embed-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str, timeout: float = None) -> list:
+        """Embeds one query, blocking until the batch containing it has run."""
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = self.embed_batch(texts)
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"embed_batch returned {len(vectors)} vectors for {len(texts)} queries")
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                # Every caller still waiting gets the error instead of blocking forever
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                with self._lock:
+                    self._metrics["errors"] += 1
+            self._record(batch, started, time.perf_counter())
+
+    def _record(self, batch, started: float, finished: float):
+        size = len(batch)
+        bucket = next((str(b) for b in _SIZE_BUCKETS if size <= b), "inf")
+        with self._lock:
+            m = self._metrics
+            m["queries"] += size
+            m["batches"] += 1
+            m["max_batch_size"] = max(m["max_batch_size"], size)
+            m["embed_seconds_total"] += finished - started
+            m["batch_size_histogram"][bucket] += 1
+            for _, _, enqueued in batch:
+                waited = started - enqueued
+                m["queue_seconds_total"] += waited
+                m["queue_seconds_max"] = max(m["queue_seconds_max"], waited)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            m = dict(self._metrics)
+            m["batch_size_histogram"] = dict(self._metrics["batch_size_histogram"])
+        queries, batches = m["queries"], m["batches"]
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queries": queries,
+            "batches": batches,
+            "errors": m["errors"],
+            "avg_batch_size": round(queries / batches, 2) if batches else 0.0,
+            "max_batch_size": m["max_batch_size"],
+            "batch_size_histogram": m["batch_size_histogram"],
+            "avg_queue_ms": round(m["queue_seconds_total"] * 1000.0 / queries, 3) if queries else 0.0,
+            "max_queue_ms": round(m["queue_seconds_max"] * 1000.0, 3),
+            "avg_embed_ms": round(m["embed_seconds_total"] * 1000.0 / batches, 3) if batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
@@ -0,0 +1,236 @@
+# backend/query_cache.py
+"""
+In-process LRU caches for retrieval.
+
+Two levels, both size-bounded:
+  * normalized query text -> query embedding
+  * (normalized query, k, filter) -> ids of the retrieved chunks, in rank order
+
+Retrieval entries are dropped whenever chunks of a source they could match are
+added, updated or deleted: entries filtered to that source, and every unfiltered
+(or non-trivially filtered) entry.
+
+Other processes writing to the same store (more uvicorn workers, the bulk_ingest
+CLI) cannot reach this process's memory, so every invalidation also bumps a
+generation counter in a small SQLite file. Lookups check it (at most every
+QUERY_CACHE_SYNC_SECONDS) and drop all retrieval entries when another process
+has bumped it.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generation counter shared by all processes using the same store
+QUERY_CACHE_GENERATION_PATH = os.getenv(
+    "QUERY_CACHE_GENERATION_PATH", os.path.join(PROJECT_ROOT, "query_cache_generation.db")
+)
+# How stale a retrieval entry can be after another process ingested (the shared counter is read at most this often)
+QUERY_CACHE_SYNC_SECONDS = float(os.getenv("QUERY_CACHE_SYNC_SECONDS", "1.0"))
+
+# Marker for entries that any source can affect
+_ANY_SOURCE = object()
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace (MiniLM's tokenizer is uncased, so the embedding is unchanged)."""
+    return " ".join((query or "").lower().split())
+
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping with least-recently-used eviction and hit/miss counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max(0, max_size)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard_where(self, predicate) -> int:
+        with self._lock:
+            doomed = [key for key in self._data if predicate(key)]
+            for key in doomed:
+                del self._data[key]
+            return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _filter_source(filter: dict):
+    """The single source a filter restricts to, or _ANY_SOURCE if it is absent or more complex."""
+    if filter and set(filter) == {"source"} and isinstance(filter["source"], str):
+        return filter["source"]
+    return _ANY_SOURCE
+
+
+class SharedGeneration:
+    """A counter in SQLite that every process bumps when it changes the store."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (1, 0)")
+            self._initialized = True
+        return conn
+
+    def read(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT value FROM generation WHERE id = 1").fetchone()[0]
+        finally:
+            conn.close()
+
+    def bump(self):
+        """Increments the counter. Returns (value before, value after)."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.execute("SELECT value FROM generation WHERE id = 1").fetchone()[0]
+            conn.execute("UPDATE generation SET value = ? WHERE id = 1", (before + 1,))
+            conn.execute("COMMIT")
+            return before, before + 1
+        finally:
+            conn.close()
+
+
+class QueryCache:
+    def __init__(self, embed_size: int = QUERY_EMBED_CACHE_SIZE, retrieval_size: int = RETRIEVAL_CACHE_SIZE,
+                 shared_path: str = QUERY_CACHE_GENERATION_PATH):
+        self.embeddings = LRUCache(embed_size)
+        self.retrievals = LRUCache(retrieval_size)
+        self.invalidations = 0
+        self.remote_invalidations = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._shared = SharedGeneration(shared_path) if shared_path else None
+        # Last shared generation this process has accounted for, and when it was checked
+        self._shared_seen = None
+        self._shared_checked = 0.0
+
+    def _drop_all(self):
+        # Caller holds self._lock
+        self._generation += 1
+        removed = self.retrievals.discard_where(lambda key: True)
+        self.invalidations += removed
+        self.remote_invalidations += 1
+
+    def _sync_shared(self):
+        """Drops every retrieval entry if another process bumped the shared generation."""
+        if self._shared is None:
+            return
+        now = time.monotonic()
+        if now - self._shared_checked < QUERY_CACHE_SYNC_SECONDS:
+            return
+        self._shared_checked = now
+        try:
+            value = self._shared.read()
+        except sqlite3.Error as e:
+            print(f"Query cache generation unavailable ({e}); dropping retrieval cache")
+            with self._lock:
+                self._drop_all()
+            return
+        with self._lock:
+            if self._shared_seen is not None and value != self._shared_seen:
+                self._drop_all()
+            self._shared_seen = value
+
+    def get_embedding(self, normalized_query: str):
+        return self.embeddings.get(normalized_query)
+
+    def put_embedding(self, normalized_query: str, embedding):
+        self.embeddings.put(normalized_query, embedding)
+
+    @staticmethod
+    def retrieval_key(normalized_query: str, k: int, filter: dict):
+        return (_filter_source(filter), normalized_query, k, json.dumps(filter, sort_keys=True) if filter else "")
+
+    def generation(self) -> int:
+        self._sync_shared()
+        return self._generation
+
+    def get_ids(self, key):
+        self._sync_shared()
+        return self.retrievals.get(key)
+
+    def put_ids(self, key, ids: list, generation: int):
+        """Stores a result computed when generation() was `generation`; dropped if an ingest happened since."""
+        with self._lock:
+            if generation == self._generation:
+                self.retrievals.put(key, ids)
+
+    def invalidate_sources(self, sources):
+        """Drops retrieval entries that chunks of these sources could appear in."""
+        sources = set(sources)
+        if not sources:
+            return
+        with self._lock:
+            self._generation += 1
+            removed = self.retrievals.discard_where(lambda key: key[0] is _ANY_SOURCE or key[0] in sources)
+            self.invalidations += removed
+        if self._shared is None:
+            return
+        try:
+            before, after = self._shared.bump()
+        except sqlite3.Error as e:
+            print(f"Could not bump the shared query cache generation: {e}")
+            return
+        with self._lock:
+            if self._shared_seen is not None and before != self._shared_seen:
+                # Another process changed the store since our last check
+                self._drop_all()
+            self._shared_seen = after
+
+    def stats(self) -> dict:
+        return {
+            "embeddings": self.embeddings.stats(),
+            "retrievals": self.retrievals.stats(),
+            "invalidated_entries": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+        }
@@ -1,137 +1,783 @@
 import os
-import chromadb
-from chromadb.config import Settings
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+import threading
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 import json
 import time
+import hashlib
+import uuid
+from bisect import bisect_right
+
+# map_reduce_summary registers its section chain on import, before llm.warm_up() compiles them
+from backend import chunk_manifest, keyword_index, llm, map_reduce_summary
+from backend.query_cache import QueryCache, normalize_query
 
 # --- Configuration ---
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CHROMA_DB_DIR = os.path.join(PROJECT_ROOT, "chroma_db")
 
-embedding_function = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+COLLECTION_NAME = "ai_tutor_knowledge"
+
+# Embedding backend: "torch" runs the model with sentence-transformers on PyTorch,
+# "onnx" runs an int8-quantized ONNX export of the same model through onnxruntime
+# (pip install "sentence-transformers[onnx]"). Both produce vectors in the same space,
+# so the existing collection keeps working; see backend/benchmarks/embedding_backends.py.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# ONNX file inside the model repo; the qint8 variants are tuned per instruction set
+# (model_quint8_avx2.onnx, model_qint8_avx512.onnx, model_qint8_avx512_vnni.onnx, model_qint8_arm64.onnx)
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "onnx/model_quint8_avx2.onnx")
+
+# Vector store: "chroma" (chroma_db/) or "numpy" (memory-mapped index in vector_index/,
+# see backend/vector_index.py). Both hold the same chunks and metadata; switching does not move
+# existing documents, use backend/migrate_vector_store.py for that.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
+
+# Retrieval: "hybrid" fuses vector similarity with BM25 keyword matches (backend/keyword_index.py)
+# by reciprocal rank fusion; "vector" is similarity search only.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+# Each ranking contributes this many candidates per requested result before fusion
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "4"))
+RRF_K = 60
+# Prompt-context selection (retrieve_context): candidates fetched per kept chunk, and the MMR
+# trade-off between relevance (1.0) and diversity (0.0)
+MMR_FETCH_FACTOR = int(os.getenv("MMR_FETCH_FACTOR", "3"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# The embedding model and Chroma store are created on first use (or by warm_up at startup),
+# not at import time, so importing this module stays cheap.
+_embedding_function = None
+_vector_store = None
+_collection = None
+_embedding_engine = None
+_query_batcher = None
+_query_cache = QueryCache()
+_init_lock = threading.Lock()
+_ready = threading.Event()
+_warmup_error = None
+
+def get_embedding_function():
+    global _embedding_function
+    if _embedding_function is None:
+        with _init_lock:
+            if _embedding_function is None:
+                _embedding_function = create_embedding_function(EMBEDDING_BACKEND)
+    return _embedding_function
+
+def create_embedding_function(backend: str = EMBEDDING_BACKEND):
+    """Builds a LangChain Embeddings object for the given backend ("torch" or "onnx")."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    if backend == "torch":
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    if backend == "onnx":
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            model_kwargs={"backend": "onnx", "model_kwargs": {"file_name": ONNX_MODEL_FILE}},
+        )
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend!r} (expected 'torch' or 'onnx')")
+
+def embedding_model_key(backend: str = EMBEDDING_BACKEND) -> str:
+    """Identifies the exact model variant, e.g. to keep cached vectors of different backends apart."""
+    if backend == "onnx":
+        return f"{EMBEDDING_MODEL_NAME}@{os.path.splitext(os.path.basename(ONNX_MODEL_FILE))[0]}"
+    return EMBEDDING_MODEL_NAME
+
+def get_embedding_engine():
+    """Shared batched embedding engine (see backend/embedding_engine.py) used by ingestion."""
+    global _embedding_engine
+    if _embedding_engine is None:
+        embedding_function = get_embedding_function()
+        with _init_lock:
+            if _embedding_engine is None:
+                from backend.embedding_engine import EmbeddingEngine
+                cache = None
+                if os.getenv("EMBED_CACHE", "true").lower() == "true":
+                    from backend.embedding_cache import EmbeddingCache
+                    cache = EmbeddingCache(embedding_model_key())
+                _embedding_engine = EmbeddingEngine(embedding_function, cache=cache)
+    return _embedding_engine
+
+def get_query_batcher():
+    """Shared micro-batcher (see backend/query_batcher.py) for query embeddings."""
+    global _query_batcher
+    if _query_batcher is None:
+        embedding_function = get_embedding_function()
+        with _init_lock:
+            if _query_batcher is None:
+                from backend.query_batcher import QueryEmbeddingBatcher
+                _query_batcher = QueryEmbeddingBatcher(embedding_function.embed_documents)
+    return _query_batcher
+
+def query_embedding_metrics():
+    """Batch-size and queue-latency metrics of the query batcher (None until first query)."""
+    return _query_batcher.metrics() if _query_batcher is not None else None
 
-vector_store = Chroma(
-    persist_directory=CHROMA_DB_DIR,
-    embedding_function=embedding_function,
-    collection_name="ai_tutor_knowledge"
-)
+def embedding_cache_metrics():
+    """Hit/miss counters of the persistent chunk-embedding cache (None until ingestion starts)."""
+    if _embedding_engine is None or _embedding_engine.cache is None:
+        return None
+    return _embedding_engine.cache.stats()
 
-def ingest_document(file_path: str, text_content: str):
+def query_cache_metrics():
+    """Hit/miss counters of the query-embedding and retrieval caches."""
+    return _query_cache.stats()
+
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        embedding_function = get_embedding_function()
+        with _init_lock:
+            if _vector_store is None:
+                from langchain_chroma import Chroma
+                _vector_store = Chroma(
+                    persist_directory=CHROMA_DB_DIR,
+                    embedding_function=embedding_function,
+                    collection_name=COLLECTION_NAME
+                )
+    return _vector_store
+
+def get_collection():
+    """
+    The chunk collection that ingestion and retrieval go through: the Chroma collection, or the
+    NumPy vector index (which implements the same add/update/delete/get/query/count subset).
+    """
+    global _collection
+    if _collection is None:
+        if VECTOR_STORE == "numpy":
+            get_embedding_function()
+            with _init_lock:
+                if _collection is None:
+                    from backend.vector_index import VectorIndex
+                    _collection = VectorIndex()
+                    if _collection.count() == 0 and os.path.isdir(CHROMA_DB_DIR):
+                        print("VECTOR_STORE=numpy but the index is empty while chroma_db/ exists; "
+                              "run `python -m backend.migrate_vector_store --to numpy` to carry documents over")
+        elif VECTOR_STORE == "chroma":
+            _collection = get_vector_store()._collection
+        else:
+            raise ValueError(f"Unknown VECTOR_STORE: {VECTOR_STORE!r} (expected 'chroma' or 'numpy')")
+    return _collection
+
+def warm_up():
+    """
+    Loads the embedding model and opens the vector store, then runs one tiny embedding so
+    the first real query does not pay for lazy framework initialization.
+    Meant to be run in a background thread at startup; see is_ready().
+    """
+    global _warmup_error
+    started = time.perf_counter()
+    try:
+        get_collection()
+        sync_keyword_index()
+        get_embedding_function().embed_query("warm up")
+        # Only now is the model actually loaded and able to answer
+        _warmup_error = None
+        _ready.set()
+        print(f"RAG warm-up finished in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        _warmup_error = str(e)
+        print(f"RAG warm-up failed: {e}")
+
+def sync_keyword_index():
+    """Backfills the keyword index from the vector store when it is empty (e.g. chunks ingested before it existed)."""
+    if keyword_index.count() > 0:
+        return
+    existing = get_collection().get(include=["documents", "metadatas"])
+    ids = existing.get("ids") or []
+    if ids:
+        keyword_index.add(ids, existing["documents"], [(meta or {}).get("source") for meta in existing["metadatas"]])
+        print(f"Keyword index backfilled with {len(ids)} chunks")
+
+def start_warm_up():
+    """Starts warm_up() in a daemon thread and returns immediately."""
+    thread = threading.Thread(target=warm_up, name="rag-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def is_ready() -> bool:
+    """True once the vector store is open and an embedding has been computed (by warm_up or a first query)."""
+    return _ready.is_set()
+
+def readiness() -> dict:
+    return {"ready": is_ready(), "error": _warmup_error, "embedding_model": embedding_model_key(),
+            "vector_store": VECTOR_STORE}
+
+def __getattr__(name):
+    # Backwards compatibility for `from backend.rag import vector_store` / `embedding_function`
+    if name == "vector_store":
+        return get_vector_store()
+    if name == "embedding_function":
+        return get_embedding_function()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+
+# Chunking parameters shared by the batch and streaming splitters.
+# CHUNKING=tokens sizes chunks in embedding-model tokens (backend/tokenization.py), so every
+# chunk fits MiniLM's 256-token window; CHUNKING=chars keeps the original character sizing.
+CHUNKING = os.getenv("CHUNKING", "tokens").lower()
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "224"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Streaming splitter re-splits its buffer once it holds this many characters
+STREAM_BUFFER_CHARS = CHUNK_SIZE * 8
+# How get_smart_document_context samples long documents: "position" (head, tail and an even
+# stride), or "kmeans" / "farthest" to cover topics using the stored chunk embeddings
+CONTEXT_SAMPLING = os.getenv("CONTEXT_SAMPLING", "position").lower()
+# Token budget (in LLM tokens) for the document content in the summary prompt
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "4500"))
+# How summarize_document reads long documents: "sample" (one call over a sampled context) or
+# "map_reduce" (summarize every section in parallel, then combine; see map_reduce_summary)
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "sample").lower()
+SUMMARY_MODES = ("sample", "map_reduce")
+
+def _get_text_splitter(chunking: str = None):
+    if (chunking or CHUNKING) == "tokens":
+        from backend.tokenization import count_tokens, require_tokenizer
+        # Loading the embedding model brings its tokenizer.json into the local cache
+        get_embedding_function()
+        require_tokenizer()
+        return RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_TOKENS,
+            chunk_overlap=CHUNK_OVERLAP_TOKENS,
+            length_function=count_tokens,
+        )
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+    )
+
+def _split_text(text_content: str):
+    return _get_text_splitter().split_text(text_content)
+
+def _chunk_starts(text: str, chunks: list) -> list:
+    """Offset of every chunk in the text it was split from (chunks are in order and may overlap)."""
+    starts, pos = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, pos)
+        if start < 0:
+            start = pos
+        starts.append(start)
+        pos = start + 1
+    return starts
+
+def _page_at(offsets: list, page_numbers: list, position: int):
+    return page_numbers[max(bisect_right(offsets, position) - 1, 0)]
+
+def _split_pages(pages) -> list:
+    """
+    Splits a document given as (page_number, text) pages into [(page_number, chunk)], where
+    page_number is the page the chunk starts on. The chunks are the same as _split_text on
+    the pages joined with newlines (what text_store.get_text returns).
+    """
+    offsets, page_numbers, texts, length = [], [], [], 0
+    for page, text in pages:
+        offsets.append(length)
+        page_numbers.append(page)
+        texts.append(text or "")
+        length += len(text or "") + 1
+    text = "\n".join(texts)
+    if not text:
+        return []
+    chunks = _split_text(text)
+    return [(_page_at(offsets, page_numbers, start), chunk) for chunk, start in zip(chunks, _chunk_starts(text, chunks))]
+
+def iter_chunks(pages):
+    """
+    Incremental splitter over an iterable of (page_number, text), yielding (page_number, chunk)
+    with the page each chunk starts on.
+    Emits the same kind of chunks as _split_text but only ever buffers a few chunks:
+    every complete chunk is yielded as soon as it is final, and the last (possibly
+    incomplete) chunk is carried into the next page so the overlap spans page boundaries.
+    """
+    splitter = _get_text_splitter()
+    buffer = ""
+    # Where each page starts in buffer
+    offsets, page_numbers = [], []
+    for page, text in pages:
+        if not text:
+            continue
+        if buffer:
+            buffer += "\n"
+        offsets.append(len(buffer))
+        page_numbers.append(page)
+        buffer += text
+        if len(buffer) < STREAM_BUFFER_CHARS:
+            continue
+        chunks = splitter.split_text(buffer)
+        starts = _chunk_starts(buffer, chunks)
+        for chunk, start in zip(chunks[:-1], starts[:-1]):
+            yield _page_at(offsets, page_numbers, start), chunk
+        if not chunks:
+            buffer, offsets, page_numbers = "", [], []
+            continue
+        carry, carry_start = chunks[-1], starts[-1]
+        marks = [(0, _page_at(offsets, page_numbers, carry_start))] + [
+            (offset - carry_start, number) for offset, number in zip(offsets, page_numbers)
+            if carry_start < offset < carry_start + len(carry)
+        ]
+        buffer = carry
+        offsets, page_numbers = [m[0] for m in marks], [m[1] for m in marks]
+    if buffer.strip():
+        chunks = splitter.split_text(buffer)
+        for chunk, start in zip(chunks, _chunk_starts(buffer, chunks)):
+            yield _page_at(offsets, page_numbers, start), chunk
+
+def _chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _load_reusable_chunks(source: str) -> dict:
+    """chunk_hash -> [chunk ids] currently stored for this source."""
+    existing = get_collection().get(where={"source": source}, include=["metadatas"])
+    reusable = {}
+    for chunk_id, meta in zip(existing.get("ids", []), existing.get("metadatas", [])):
+        reusable.setdefault((meta or {}).get("chunk_hash"), []).append(chunk_id)
+    return reusable
+
+def _write_embedded_chunks(texts: list, vectors: list, payload):
+    """Embedding pipeline sink: writes pre-embedded chunks to the vector store."""
+    ids, metadatas = payload
+    get_collection().add(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+    keyword_index.add(ids, texts, [meta["source"] for meta in metadatas])
+    _query_cache.invalidate_sources({meta["source"] for meta in metadatas})
+
+def _delete_chunks(source: str, ids: list):
+    get_collection().delete(ids=ids)
+    keyword_index.delete(ids)
+    _query_cache.invalidate_sources([source])
+
+def _chunk_metadata(source: str, index: int, chunk_hash: str, version: int, page) -> dict:
+    metadata = {"source": source, "chunk_index": index, "chunk_hash": chunk_hash, "doc_version": version}
+    if page is not None:
+        metadata["page"] = page
+    return metadata
+
+def _ingest_chunks(source: str, chunks, version: int = 1, progress=None, progress_total: int = None):
+    """
+    Core of incremental ingestion. Consumes (page_number, chunk) pairs lazily (page_number
+    may be None when the text has no pages) and hands new ones to the embedding
+    engine in INGEST_BATCH_SIZE batches through a bounded queue, so only a few batches are
+    ever held in memory and chunking overlaps inference.
+    Chunks already stored for this source (matched by text hash) keep their embeddings
+    and only get their chunk_index/version metadata updated; new or changed chunks are
+    embedded; stored chunks that no longer occur are deleted at the end.
+    """
+    reusable = _load_reusable_chunks(source)
+
+    stats = {"chunks_total": 0, "chunks_embedded": 0, "chunks_reused": 0, "chunks_deleted": 0, "version": version}
+    kept_ids, kept_metas = [], []
+    new_texts, new_ids, new_metas = [], [], []
+    manifest_ids, manifest_lengths = [], []
+
+    def sink(texts, vectors, payload):
+        _write_embedded_chunks(texts, vectors, payload)
+        stats["chunks_embedded"] += len(texts)
+        if progress:
+            progress(stats["chunks_embedded"], progress_total)
+
+    def flush_kept():
+        if kept_ids:
+            # Metadata-only update: no re-embedding of unchanged chunks
+            get_collection().update(ids=kept_ids, metadatas=kept_metas)
+            _query_cache.invalidate_sources([source])
+            stats["chunks_reused"] += len(kept_ids)
+            kept_ids.clear()
+            kept_metas.clear()
+
+    with get_embedding_engine().pipeline(sink) as pipeline:
+        def flush_new():
+            if new_texts:
+                pipeline.submit(list(new_texts), (list(new_ids), list(new_metas)))
+                new_texts.clear()
+                new_ids.clear()
+                new_metas.clear()
+
+        for i, (page, t) in enumerate(chunks):
+            stats["chunks_total"] += 1
+            h = _chunk_hash(t)
+            metadata = _chunk_metadata(source, i, h, version, page)
+            if reusable.get(h):
+                chunk_id = reusable[h].pop()
+                kept_ids.append(chunk_id)
+                kept_metas.append(metadata)
+                if len(kept_ids) >= INGEST_BATCH_SIZE:
+                    flush_kept()
+            else:
+                chunk_id = uuid.uuid4().hex
+                new_texts.append(t)
+                new_ids.append(chunk_id)
+                new_metas.append(metadata)
+                if len(new_texts) >= INGEST_BATCH_SIZE:
+                    flush_new()
+            manifest_ids.append(chunk_id)
+            manifest_lengths.append(len(t))
+        flush_kept()
+        flush_new()
+
+    stale_ids = [chunk_id for ids in reusable.values() for chunk_id in ids]
+    if stale_ids:
+        _delete_chunks(source, stale_ids)
+    stats["chunks_deleted"] = len(stale_ids)
+    chunk_manifest.put(source, version, manifest_ids, manifest_lengths)
+    return stats
+
+def reingest_document(source: str, text_content: str, version: int = 1, progress=None):
+    """
+    Versioned, incremental ingestion of a document under the given source key.
+    Chunks are identified by a hash of their text: chunks already stored for this source
+    are kept (only their chunk_index/version metadata is updated), new or changed chunks
+    are embedded, and chunks that no longer occur are deleted.
+    progress, if given, is called as progress(chunks_embedded, chunks_total) after each batch.
+    Returns a stats dict.
+    """
+    chunks = [(None, t) for t in _split_text(text_content)] if text_content else []
+    return _ingest_chunks(source, chunks, version=version, progress=progress, progress_total=len(chunks))
+
+def ingest_pages(source: str, pages, version: int = 1, progress=None):
+    """
+    reingest_document for a document given as (page_number, text) pages, e.g. from
+    text_store.iter_document_pages: same chunks, and every chunk's metadata records the
+    page it starts on.
+    """
+    chunks = _split_pages(pages)
+    return _ingest_chunks(source, chunks, version=version, progress=progress, progress_total=len(chunks))
+
+def ingest_stream(source: str, pages, version: int = 1, progress=None):
+    """
+    Streaming extract -> split -> embed pipeline for very large files.
+    pages is an iterable of (page_number, text), e.g. ingest_utils.iter_text_pages(path);
+    chunking and embedding happen as pages arrive so memory stays flat regardless of
+    document size. Same incremental semantics and stats as reingest_document.
+    """
+    return _ingest_chunks(source, iter_chunks(pages), version=version, progress=progress)
+
+def ingest_documents_batch(items, progress=None):
+    """
+    Ingest several documents with consolidated vector store writes.
+    items is an iterable of (source, pages, version), pages being a list of (page_number, text)
+    as for ingest_pages; it may be lazy (e.g. yielding
+    documents as their extraction finishes) so extraction and embedding overlap. Each document
+    gets the same incremental treatment as reingest_document, but new chunks from all documents
+    are pooled and written in full INGEST_BATCH_SIZE batches instead of one write per file.
+    progress, if given, is called as progress(chunks_embedded, None) after each write.
+    Every source may appear only once: a repeat would compute chunk reuse before the
+    earlier item's chunks are written. Raises ValueError on a repeated source.
+    Returns {source: stats}.
+    """
+    all_stats = {}
+    manifests = {}
+    pending_texts, pending_ids, pending_metas = [], [], []
+    embedded = 0
+
+    def sink(texts, vectors, payload):
+        nonlocal embedded
+        _write_embedded_chunks(texts, vectors, payload)
+        embedded += len(texts)
+        if progress:
+            progress(embedded, None)
+
+    with get_embedding_engine().pipeline(sink) as pipeline:
+        def flush(count):
+            pipeline.submit(pending_texts[:count], (pending_ids[:count], pending_metas[:count]))
+            del pending_texts[:count], pending_ids[:count], pending_metas[:count]
+
+        for source, pages, version in items:
+            if source in manifests:
+                raise ValueError(f"Source {source!r} appears more than once in the batch")
+            reusable = _load_reusable_chunks(source)
+            chunks = _split_pages(pages)
+            texts = [t for _, t in chunks]
+            kept_ids, kept_metas = [], []
+            manifest_ids = []
+            new_count = 0
+            for i, (page, t) in enumerate(chunks):
+                h = _chunk_hash(t)
+                metadata = _chunk_metadata(source, i, h, version, page)
+                if reusable.get(h):
+                    chunk_id = reusable[h].pop()
+                    kept_ids.append(chunk_id)
+                    kept_metas.append(metadata)
+                else:
+                    chunk_id = uuid.uuid4().hex
+                    pending_texts.append(t)
+                    pending_ids.append(chunk_id)
+                    pending_metas.append(metadata)
+                    new_count += 1
+                manifest_ids.append(chunk_id)
+            manifests[source] = (version, manifest_ids, [len(t) for t in texts])
+
+            stale_ids = [chunk_id for ids in reusable.values() for chunk_id in ids]
+            if stale_ids:
+                _delete_chunks(source, stale_ids)
+            if kept_ids:
+                get_collection().update(ids=kept_ids, metadatas=kept_metas)
+                _query_cache.invalidate_sources([source])
+
+            all_stats[source] = {
+                "chunks_total": len(texts),
+                "chunks_embedded": new_count,
+                "chunks_reused": len(kept_ids),
+                "chunks_deleted": len(stale_ids),
+                "version": version,
+            }
+            while len(pending_texts) >= INGEST_BATCH_SIZE:
+                flush(INGEST_BATCH_SIZE)
+
+        if pending_texts:
+            flush(len(pending_texts))
+
+    # Written once every chunk is in the store, so a manifest never points at missing chunks
+    for source, (version, manifest_ids, lengths) in manifests.items():
+        chunk_manifest.put(source, version, manifest_ids, lengths)
+    return all_stats
+
+def ingest_document(file_path: str, text_content: str, progress=None, source: str = None, version: int = 1):
     """
     Splits text into chunks and adds them to the vector store.
+    The source key defaults to the file name. Re-ingesting an existing source only embeds
+    changed chunks (see reingest_document).
+    progress, if given, is called as progress(chunks_embedded, chunks_to_embed) after each batch.
     """
     if not text_content:
         return 0
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-    )
-    texts = text_splitter.split_text(text_content)
+    source = source or os.path.basename(file_path)
+    stats = reingest_document(source, text_content, version=version, progress=progress)
+    return stats["chunks_total"]
 
-    filename = os.path.basename(file_path)
-    docs = [
-        Document(page_content=t, metadata={"source": filename, "chunk_index": i})
-        for i, t in enumerate(texts)
-    ]
+def _chunks_to_documents(ids, texts, metadatas):
+    return [Document(page_content=text, metadata=meta or {}, id=chunk_id)
+            for chunk_id, text, meta in zip(ids, texts, metadatas)]
 
-    if docs:
-        vector_store.add_documents(docs)
-    
-    return len(docs)
+def _fetch_chunks(ids: list) -> dict:
+    """chunk id -> (text, metadata) for the ids that exist."""
+    if not ids:
+        return {}
+    found = get_collection().get(ids=ids, include=["documents", "metadatas"])
+    return {chunk_id: (text, meta) for chunk_id, text, meta in zip(found["ids"], found["documents"], found["metadatas"])}
+
+def _load_chunks(ids: list):
+    """Documents for cached chunk ids in the given order, or None if any of them is gone."""
+    by_id = _fetch_chunks(ids)
+    if len(by_id) != len(ids):
+        return None
+    return _chunks_to_documents(ids, [by_id[i][0] for i in ids], [by_id[i][1] for i in ids])
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> list:
+    """Fuses ranked id lists: score(id) = sum of 1 / (k + rank). Ties keep first-seen order."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def _keyword_source(filter: dict):
+    """(searchable, source) for the keyword side: only no filter or a plain source filter is supported."""
+    if not filter:
+        return True, None
+    if set(filter) == {"source"} and isinstance(filter["source"], str):
+        return True, filter["source"]
+    return False, None
+
+def _embed_query(normalized_query: str):
+    embedding = _query_cache.get_embedding(normalized_query)
+    if embedding is None:
+        # Embedded through the shared batcher so concurrent requests share a forward pass
+        embedding = get_query_batcher().embed(normalized_query)
+        _query_cache.put_embedding(normalized_query, embedding)
+        # Without warm-up (RAG_WARMUP=false) the first answered query marks the service ready
+        if _collection is not None:
+            _ready.set()
+    return embedding
 
 def query_knowledge_base(query: str, k: int = 3, filter: dict = None):
-    results = vector_store.similarity_search(query, k=k, filter=filter)
+    normalized = normalize_query(query)
+    key = _query_cache.retrieval_key(normalized, k, filter)
+    generation = _query_cache.generation()
+
+    cached_ids = _query_cache.get_ids(key)
+    if cached_ids is not None:
+        results = _load_chunks(cached_ids)
+        if results is not None:
+            return results
+
+    searchable, source = _keyword_source(filter)
+    hybrid = RETRIEVAL_MODE == "hybrid" and searchable
+    candidates = k * max(1, HYBRID_CANDIDATE_FACTOR) if hybrid else k
+
+    found = get_collection().query(
+        query_embeddings=[_embed_query(normalized)],
+        n_results=candidates,
+        where=filter,
+        include=["documents", "metadatas"],
+    )
+    ids = found["ids"][0] if found["ids"] else []
+    by_id = dict(zip(ids, zip(found["documents"][0], found["metadatas"][0]))) if ids else {}
+
+    if hybrid:
+        keyword_ids = keyword_index.search(query, k=candidates, source=source)
+        ids = reciprocal_rank_fusion([ids, keyword_ids])[:k]
+        # Keyword-only hits are not in the vector results yet
+        by_id.update(_fetch_chunks([i for i in ids if i not in by_id]))
+        ids = [i for i in ids if i in by_id]
+
+    results = _chunks_to_documents(ids, [by_id[i][0] for i in ids], [by_id[i][1] for i in ids])
+    _query_cache.put_ids(key, ids, generation)
     return results
 
-def get_smart_document_context(file_id: str, max_chars: int = 18000):
+def retrieve_context(query: str, k: int = 3, filter: dict = None, fetch_k: int = None, lambda_mult: float = MMR_LAMBDA):
+    """
+    Retrieval for LLM prompts: fetches fetch_k candidates, keeps k of them by maximal marginal
+    relevance (using the stored chunk embeddings, no extra inference), then merges chunks that
+    are adjacent in their document and strips the duplicated overlap
+    (see backend/context_selection.py). May return fewer than k Documents after merging.
+    """
+    from backend.context_selection import merge_adjacent, mmr_select
+
+    fetch_k = fetch_k or k * MMR_FETCH_FACTOR
+    candidates = query_knowledge_base(query, k=fetch_k, filter=filter)
+    if len(candidates) > k:
+        try:
+            found = get_collection().get(ids=[doc.id for doc in candidates], include=["embeddings"])
+            vectors = dict(zip(found["ids"], found["embeddings"]))
+            candidates = [doc for doc in candidates if doc.id in vectors]
+            order = mmr_select(_embed_query(normalize_query(query)), [vectors[doc.id] for doc in candidates],
+                               k, lambda_mult)
+            candidates = [candidates[i] for i in order]
+        except Exception as e:
+            print(f"MMR selection failed, using top {k}: {e}")
+            candidates = candidates[:k]
+    return merge_adjacent(candidates)
+
+async def aretrieve_context(query: str, k: int = 3, filter: dict = None):
+    """retrieve_context for async endpoints (runs in the thread pool)."""
+    from starlette.concurrency import run_in_threadpool
+    return await run_in_threadpool(retrieve_context, query, k=k, filter=filter)
+
+async def aquery_knowledge_base(query: str, k: int = 3, filter: dict = None):
+    """
+    query_knowledge_base for async endpoints. Runs in the thread pool so the event loop keeps
+    accepting requests while this one waits for its embedding batch.
+    """
+    from starlette.concurrency import run_in_threadpool
+    return await run_in_threadpool(query_knowledge_base, query, k=k, filter=filter)
+
+def _sample_chunk_indexes(lengths: list, max_chars: int) -> list:
+    """
+    Indexes of the chunks to keep so the joined text stays near max_chars: all of them if
+    they fit, otherwise the first 20%, the last 10% and an even stride through the middle.
+    """
+    total_docs = len(lengths)
+    full_length = sum(lengths) + 2 * max(0, total_docs - 1)
+    if full_length <= max_chars:
+        return list(range(total_docs))
+
+    avg_chunk_size = full_length / (total_docs + 1)
+    max_chunks = int(max_chars / avg_chunk_size)
+
+    if max_chunks >= total_docs:
+        return list(range(total_docs))
+
+    start_alloc = max(1, int(max_chunks * 0.20))
+    end_alloc = max(1, int(max_chunks * 0.10))
+    middle_alloc = max_chunks - start_alloc - end_alloc
+
+    if middle_alloc < 0:
+        middle_alloc = 0
+
+    selected_indices = set()
+
+    for i in range(min(start_alloc, total_docs)):
+        selected_indices.add(i)
+
+    for i in range(max(0, total_docs - end_alloc), total_docs):
+        selected_indices.add(i)
+
+    middle_start = start_alloc
+    middle_end = max(start_alloc, total_docs - end_alloc)
+    sample_range = middle_end - middle_start
+
+    if sample_range > 0 and middle_alloc > 0:
+        step = sample_range / middle_alloc
+        for i in range(middle_alloc):
+            idx = int(middle_start + i * step)
+            if idx < total_docs:
+                selected_indices.add(idx)
+
+    return sorted(selected_indices)
+
+def _build_manifest(file_id: str):
+    """Manifest for a source ingested before manifests existed, built from one full scan."""
+    results = get_collection().get(where={"source": file_id}, include=["documents", "metadatas"])
+    if not results or not results["ids"]:
+        return None
+    chunks = sorted(
+        zip(results["ids"], results["documents"], results["metadatas"]),
+        key=lambda c: (c[2] or {}).get("chunk_index", 999999),
+    )
+    version = max((meta or {}).get("doc_version", 1) for _, _, meta in chunks)
+    chunk_manifest.put(file_id, version, [c[0] for c in chunks], [len(c[1] or "") for c in chunks])
+    return chunk_manifest.get(file_id)
+
+def _select_chunk_ids(manifest: dict, max_chars: int, mode: str) -> list:
+    lengths = manifest["lengths"]
+    if mode == "position":
+        indexes = _sample_chunk_indexes(lengths, max_chars)
+    elif sum(lengths) + 2 * (len(lengths) - 1) <= max_chars:
+        indexes = list(range(len(lengths)))
+    else:
+        from backend.context_selection import diverse_chunk_indexes
+        # Stored embeddings only: no model inference
+        found = get_collection().get(ids=manifest["chunk_ids"], include=["embeddings"])
+        vectors = dict(zip(found["ids"], found["embeddings"]))
+        present = [i for i, chunk_id in enumerate(manifest["chunk_ids"]) if chunk_id in vectors]
+        chosen = diverse_chunk_indexes(
+            [vectors[manifest["chunk_ids"][i]] for i in present], [lengths[i] for i in present], max_chars, mode
+        )
+        indexes = [present[i] for i in chosen]
+    return [manifest["chunk_ids"][i] for i in indexes]
+
+def get_smart_document_context(file_id: str, max_chars: int = 18000, mode: str = None):
     """
     Retrieves a 'smart' context using STRICT strict sampling to stay under limits.
+    Chunks are chosen from the document's chunk manifest, by position or by topic coverage
+    (mode, default CONTEXT_SAMPLING); only the chosen ones are read, and the result is cached
+    per (file_id, max_chars, document version, mode).
     """
+    mode = (mode or CONTEXT_SAMPLING).lower()
     try:
-        results = vector_store.get(where={"source": file_id})
-        
-        if not results or not results['documents']:
+        manifest = chunk_manifest.get(file_id) or _build_manifest(file_id)
+        if not manifest or not manifest["chunk_ids"]:
             return ""
 
-        chunks = []
-        for doc, meta in zip(results['documents'], results['metadatas']):
-            chunks.append({"text": doc, "index": meta.get("chunk_index", 999999)})
-        
-        chunks.sort(key=lambda x: x["index"])
-        
-        full_docs = [c["text"] for c in chunks]
-        total_docs = len(full_docs)
-        
-        if total_docs == 0:
-            return ""
-            
-        full_text = "\n\n".join(full_docs)
-        
-        if len(full_text) <= max_chars:
-            return full_text
-            
-        avg_chunk_size = len(full_text) / (total_docs + 1)
-        max_chunks = int(max_chars / avg_chunk_size)
-        
-        if max_chunks >= total_docs:
-             return full_text
-             
-        start_alloc = max(1, int(max_chunks * 0.20))
-        end_alloc = max(1, int(max_chunks * 0.10))
-        middle_alloc = max_chunks - start_alloc - end_alloc
-        
-        if middle_alloc < 0:
-             middle_alloc = 0
-             
-        selected_indices = set()
-        
-        for i in range(min(start_alloc, total_docs)):
-            selected_indices.add(i)
-        
-        for i in range(max(0, total_docs - end_alloc), total_docs):
-            selected_indices.add(i)
-            
-        middle_start = start_alloc
-        middle_end = max(start_alloc, total_docs - end_alloc)
-        sample_range = middle_end - middle_start
-        
-        if sample_range > 0 and middle_alloc > 0:
-            step = sample_range / middle_alloc
-            for i in range(middle_alloc):
-                idx = int(middle_start + i * step)
-                if idx < total_docs:
-                    selected_indices.add(idx)
-        
-        final_indices = sorted(list(selected_indices))
-        selected_docs = [full_docs[i] for i in final_indices]
-        
-        final_context = "\n\n".join(selected_docs)
+        cached = chunk_manifest.get_context(file_id, max_chars, manifest["version"], mode)
+        if cached is not None:
+            return cached
+
+        chunk_ids = _select_chunk_ids(manifest, max_chars, mode)
+        by_id = _fetch_chunks(chunk_ids)
+        if len(by_id) != len(chunk_ids):
+            # Manifest out of date with the store: rebuild it from a full scan once
+            manifest = _build_manifest(file_id)
+            if not manifest:
+                return ""
+            chunk_ids = _select_chunk_ids(manifest, max_chars, mode)
+            by_id = _fetch_chunks(chunk_ids)
+
+        final_context = "\n\n".join(by_id[i][0] for i in chunk_ids if i in by_id)
+        chunk_manifest.put_context(file_id, max_chars, manifest["version"], mode, final_context)
         return final_context
         
     except Exception as e:
         print(f"Error in smart context retrieval: {e}")
         return ""
 
-def summarize_text(text: str, max_length: int = 400):
-    """
-    Generate a Pedagogical Summary formatted with HTML tags using strict user-defined JSON schema.
-    """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("GROQ_API_KEY not set")
+# Bump when the summarize_text prompt changes: stored summaries of older prompts are not served
+SUMMARY_PROMPT_VERSION = "1"
 
-    llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0.3, api_key=api_key)
-    
-    prompt = ChatPromptTemplate.from_template("""
+SUMMARY_CHAIN = llm.register_chain("document_summary", """
 SYSTEM: You are an expert AI Tutor. You will be given extracted content from a document. Produce a single JSON object (no extra text) in the exact format described below. Follow every rule strictly.
 
 OUTPUT JSON schema (MUST match exactly):
@@ -166,15 +812,29 @@ Now, given the following content between the markers, produce the JSON exactly:
 <<<CONTENT>>>
 {text}
 <<<CONTENT>>>
-""")
-    
-    chain = prompt | llm | StrOutputParser()
-    
+""", temperature=0.3)
+
+def summary_prompt_version(mode: str = None) -> str:
+    """Version tag of everything that shapes a document summary in the given mode."""
+    mode = (mode or SUMMARY_MODE).lower()
+    if mode == "map_reduce":
+        return f"{SUMMARY_PROMPT_VERSION}.{map_reduce_summary.SECTION_PROMPT_VERSION}"
+    return SUMMARY_PROMPT_VERSION
+
+def summarize_text(text: str, max_length: int = 400):
+    """
+    Generate a Pedagogical Summary formatted with HTML tags using strict user-defined JSON schema.
+    """
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("GROQ_API_KEY not set")
+
     try:
-        # Safe context limit
-        safe_text = text[:18000]
+        # Safe context limit, counted in tokens
+        from backend.tokenization import llm_token_budget, truncate_to_tokens
+        safe_text = truncate_to_tokens(text, llm_token_budget(SUMMARY_CONTEXT_TOKENS))
         
-        response = chain.invoke({"text": safe_text})
+        response = SUMMARY_CHAIN.invoke({"text": safe_text})
         
         # Clean up response
         response = response.strip()
@@ -205,14 +865,81 @@ Now, given the following content between the markers, produce the JSON exactly:
             "key_points": []
         }
 
-def summarize_document(file_id: str, max_length: int = 500):
+def _stored_document_text(file_id: str, max_chars: int):
+    from backend import documents, text_store
+    db = documents.SessionLocal()
+    try:
+        doc = documents.find_by_file_id(db, file_id)
+    finally:
+        db.close()
+    if doc is None or not text_store.has_document(doc.sha256):
+        return ""
+    return text_store.get_preview(doc.sha256, max_chars)
+
+def _document_chunks(file_id: str) -> list:
+    """All chunk texts of a document in order: from the vector store, else re-split from the text store."""
+    manifest = chunk_manifest.get(file_id) or _build_manifest(file_id)
+    if manifest and manifest["chunk_ids"]:
+        by_id = _fetch_chunks(manifest["chunk_ids"])
+        if len(by_id) == len(manifest["chunk_ids"]):
+            return [by_id[i][0] for i in manifest["chunk_ids"]]
+        manifest = _build_manifest(file_id)
+        if manifest:
+            by_id = _fetch_chunks(manifest["chunk_ids"])
+            return [by_id[i][0] for i in manifest["chunk_ids"] if i in by_id]
+
+    from backend import documents, text_store
+    db = documents.SessionLocal()
+    try:
+        doc = documents.find_by_file_id(db, file_id)
+    finally:
+        db.close()
+    if doc is None or not text_store.has_document(doc.sha256):
+        return []
+    return _split_text(text_store.get_text(doc.sha256))
+
+def _summarize_document_map_reduce(file_id: str, max_length: int):
+    from backend.tokenization import count_tokens, llm_token_budget
+    chunks = _document_chunks(file_id)
+    if not chunks:
+        return None
+    budget = llm_token_budget(SUMMARY_CONTEXT_TOKENS)
+    if sum(count_tokens(c) for c in chunks) <= budget:
+        # Fits in one prompt: nothing to map
+        from backend.context_selection import join_without_overlap
+        text = chunks[0]
+        for chunk in chunks[1:]:
+            text = join_without_overlap(text, chunk)
+        return summarize_text(text, max_length)
+    try:
+        return map_reduce_summary.summarize_chunks(chunks, summarize_text, budget, max_length)
+    except Exception as e:
+        print(f"Map-reduce summary error, falling back to sampling: {e}")
+        return None
+
+def summarize_document(file_id: str, max_length: int = 500, mode: str = None):
     """
-    Summarizes a document using strict sampling.
+    Summarizes a document using strict sampling, or section by section when mode
+    (default SUMMARY_MODE) is "map_reduce".
     """
+    fallback = False
+    if (mode or SUMMARY_MODE).lower() == "map_reduce":
+        result = _summarize_document_map_reduce(file_id, max_length)
+        if result is not None:
+            return result
+        fallback = True
+
     # Use STRICT strict limit
     full_text = get_smart_document_context(file_id, max_chars=18000)
+    if not full_text:
+        # Not (yet) in the vector store: fall back to the extracted text store
+        full_text = _stored_document_text(file_id, max_chars=18000)
     
     if not full_text:
         return {"summary_paragraphs": ["No text found."], "key_points": [], "topic": "Empty"}
     
-    return summarize_text(full_text, max_length)
+    result = summarize_text(full_text, max_length)
+    if fallback and isinstance(result, dict):
+        # Sampled instead of map-reduced: served, but not stored as the map-reduce summary
+        result["fallback"] = "sampling"
+    return result
@@ -7,10 +7,31 @@ from datetime import datetime
 
 from backend.db import get_db
 from backend.models import User, QuizAttempt
-from backend.rag import query_knowledge_base
+from backend.rag import aquery_knowledge_base
+from backend import llm
 
 router = APIRouter(prefix="/api/learning", tags=["adaptive_learning"])
 
+LESSON_CHAIN = llm.register_chain("adaptive_lesson", """
+        You are an AI Tutor teaching a {performance_level} student about: {topic}
+        
+        Teaching Style Instructions:
+        {teaching_style}
+        
+        Course Material:
+        {context}
+        
+        Create a comprehensive lesson that:
+        1. Introduces the topic appropriately for this student's level.
+        2. Explains key concepts using the course material.
+        3. Provides examples relevant to their understanding.
+        4. Includes practice questions at the right difficulty.
+        5. Summarizes main takeaways.
+        
+        Format the lesson in a clear, structured way using Markdown (headers, bullet points, bold text).
+        Make it engaging and interactive.
+        """, temperature=0.7)
+
 class LearningRecommendation(BaseModel):
     performance_level: str
     avg_score: float
@@ -135,7 +156,7 @@ async def generate_adaptive_lesson(req: LessonRequest, db: Session = Depends(get
     
     # Get relevant content from uploaded materials
     topic = req.topic if req.topic else "general course content"
-    results = query_knowledge_base(topic, k=5)
+    results = await aquery_knowledge_base(topic, k=5)
     
     if not results:
         raise HTTPException(status_code=400, detail="No course materials found. Please upload PDFs first.")
@@ -144,16 +165,11 @@ async def generate_adaptive_lesson(req: LessonRequest, db: Session = Depends(get
     
     # Generate adaptive lesson using OpenAI
     try:
-        from langchain_groq import ChatGroq
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
         import os
         
         if not os.getenv("GROQ_API_KEY"):
             raise HTTPException(status_code=500, detail="Groq API key not configured. Get one free at https://console.groq.com")
         
-        llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0.7)
-        
         # Customize prompt based on performance level
         level = user.performance_level
         
@@ -175,28 +191,7 @@ async def generate_adaptive_lesson(req: LessonRequest, db: Session = Depends(get
             Encourage critical thinking and independent exploration.
             """
         
-        prompt = ChatPromptTemplate.from_template("""
-        You are an AI Tutor teaching a {performance_level} student about: {topic}
-        
-        Teaching Style Instructions:
-        {teaching_style}
-        
-        Course Material:
-        {context}
-        
-        Create a comprehensive lesson that:
-        1. Introduces the topic appropriately for this student's level.
-        2. Explains key concepts using the course material.
-        3. Provides examples relevant to their understanding.
-        4. Includes practice questions at the right difficulty.
-        5. Summarizes main takeaways.
-        
-        Format the lesson in a clear, structured way using Markdown (headers, bullet points, bold text).
-        Make it engaging and interactive.
-        """)
-        
-        chain = prompt | llm | StrOutputParser()
-        lesson = chain.invoke({
+        lesson = await LESSON_CHAIN.ainvoke({
             "performance_level": level,
             "topic": topic,
             "teaching_style": teaching_style,
@@ -7,10 +7,43 @@ from datetime import datetime
 
 from backend.db import get_db
 from backend.models import Message, User
-from backend.rag import query_knowledge_base
+from backend.rag import aretrieve_context
+from backend import llm
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
+CHAT_WITH_CONTEXT_CHAIN = llm.register_chain("chat_with_context", """
+You are a helpful, friendly AI Tutor. Your goal is to help the student understand the material, not just give them the answer.
+
+Context from uploaded course materials:
+{context}
+
+Student's Question:
+{question}
+
+Instructions:
+1. Use the provided context to answer the question.
+2. If the context is relevant, explain the concept clearly using examples from the text.
+3. If the context is NOT relevant, use your general knowledge but explicitly state: "I couldn't find this in your uploaded notes, but here is a general explanation..."
+4. Be encouraging and concise.
+5. Do not make up facts if they are not in the context or your general knowledge.
+
+Your helpful answer:
+""", temperature=0.7)
+
+CHAT_GENERAL_CHAIN = llm.register_chain("chat_general", """
+You are a helpful, friendly AI Tutor. The student has asked a question, but no course materials have been uploaded yet.
+
+Provide a helpful, educational answer using your general knowledge. Be clear, conversational, and break down complex topics.
+
+At the end, mention: "💡 Tip: For answers specific to your course, ask your teacher to upload course materials!"
+
+Student's Question:
+{question}
+
+Your helpful answer:
+""", temperature=0.7)
+
 class ChatRequest(BaseModel):
     user_id: str # For now, we use the string ID from frontend (e.g. "student_demo")
     course_id: Optional[str] = None
@@ -78,7 +111,7 @@ async def chat_endpoint(req: ChatRequest, db: Session = Depends(get_db)):
         db.commit()
         
         # 2. Retrieve relevant context
-        results = query_knowledge_base(req.message, k=3)
+        results = await aretrieve_context(req.message, k=3)
         
         # Format context
         context_text = "\n\n".join([doc.page_content for doc in results])
@@ -86,55 +119,17 @@ async def chat_endpoint(req: ChatRequest, db: Session = Depends(get_db)):
         # 3. Generate Answer with OpenAI
         answer_text = ""
         
-        from langchain_groq import ChatGroq
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
         import os
         
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             answer_text = "⚠️ Groq API key not configured. Please set GROQ_API_KEY in the .env file. Get one free at https://console.groq.com"
-        else:
-            llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0.7, api_key=api_key)
-            
+        elif context_text and len(context_text.strip()) > 0:
             # If we have context from documents, use it
-            if context_text and len(context_text.strip()) > 0:
-                prompt = ChatPromptTemplate.from_template("""
-You are a helpful, friendly AI Tutor. Your goal is to help the student understand the material, not just give them the answer.
-
-Context from uploaded course materials:
-{context}
-
-Student's Question:
-{question}
-
-Instructions:
-1. Use the provided context to answer the question.
-2. If the context is relevant, explain the concept clearly using examples from the text.
-3. If the context is NOT relevant, use your general knowledge but explicitly state: "I couldn't find this in your uploaded notes, but here is a general explanation..."
-4. Be encouraging and concise.
-5. Do not make up facts if they are not in the context or your general knowledge.
-
-Your helpful answer:
-""")
-                chain = prompt | llm | StrOutputParser()
-                answer_text = chain.invoke({"context": context_text, "question": req.message})
-            else:
-                # No documents uploaded yet, use general knowledge
-                prompt = ChatPromptTemplate.from_template("""
-You are a helpful, friendly AI Tutor. The student has asked a question, but no course materials have been uploaded yet.
-
-Provide a helpful, educational answer using your general knowledge. Be clear, conversational, and break down complex topics.
-
-At the end, mention: "💡 Tip: For answers specific to your course, ask your teacher to upload course materials!"
-
-Student's Question:
-{question}
-
-Your helpful answer:
-""")
-                chain = prompt | llm | StrOutputParser()
-                answer_text = chain.invoke({"question": req.message})
+            answer_text = await CHAT_WITH_CONTEXT_CHAIN.ainvoke({"context": context_text, "question": req.message})
+        else:
+            # No documents uploaded yet, use general knowledge
+            answer_text = await CHAT_GENERAL_CHAIN.ainvoke({"question": req.message})
 
         # 4. Save AI Message
         ai_msg = Message(user_id=user.id, role="ai", content=answer_text)
@@ -1,7 +1,18 @@
 import os
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+import hashlib
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from fastapi.responses import JSONResponse
-from backend.ingest_utils import extract_text, save_preview
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from backend.db import get_db
+from backend import documents, summaries, text_store
+from backend.ingest_utils import SUPPORTED_EXTENSIONS
+from backend.jobs import (
+    IngestionJob, QueueFullError, STAGE_EMBEDDING, STAGE_EXTRACTING, STAGE_STREAMING,
+    get_job, queue_stats, submit_job,
+)
 
 router = APIRouter(prefix="/api/content", tags=["content"])
 
@@ -11,20 +22,81 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 UPLOADS_DIR = os.path.join(PROJECT_ROOT, "uploads")
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...), user_id: str = Form(...), user_role: str = Form("teacher")):
+# Uploads larger than this are rejected (default 250 MB)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(250 * 1024 * 1024)))
+# Size of each read from the request body while streaming to disk
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Files at least this large are ingested through the streaming page -> chunk -> embed pipeline
+STREAM_INGEST_MIN_BYTES = int(os.getenv("STREAM_INGEST_MIN_BYTES", str(20 * 1024 * 1024)))
+# Batch uploads: maximum files per request and files extracted concurrently by the batch job
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "100"))
+BATCH_EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", "4"))
+
+
+async def _stream_upload_to_disk(file: UploadFile, save_path: str, max_bytes: int = MAX_UPLOAD_BYTES):
     """
-    Save uploaded file to the uploads/ folder and return metadata.
-    Supports: PDF, DOCX, PPTX, TXT, MD, CSV, and images (PNG, JPG, JPEG, BMP, TIFF, GIF)
-    Both teachers and students can upload.
+    Copy an UploadFile to save_path in fixed-size chunks, hashing and counting bytes as they are written.
+    Only one chunk is held in memory at a time. Raises HTTP 413 as soon as the size cap is exceeded
+    and never leaves a partial file behind.
+    Returns (size_bytes, sha256_hex).
+    """
+    # Reject early when the client already told us the size
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes} bytes")
+
+    tmp_path = save_path + ".part"
+    sha256 = hashlib.sha256()
+    size = 0
+    out = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes} bytes")
+            sha256.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+        await run_in_threadpool(out.close)
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        out.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return size, sha256.hexdigest()
+
+def _reserve_upload_path(user_dir: str, stem: str, file_ext: str):
+    """
+    Atomically claims a free filename in user_dir by creating it empty (O_CREAT | O_EXCL), so
+    files with the same name in one batch or in concurrent requests never get the same path.
+    Returns (filename, path); the upload later replaces the empty placeholder.
+    """
+    counter = 0
+    while True:
+        filename = f"{stem}{file_ext}" if counter == 0 else f"{stem}_{counter}{file_ext}"
+        path = os.path.join(user_dir, filename)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return filename, path
+        except FileExistsError:
+            counter += 1
+
+async def _save_upload(file: UploadFile, user_id: str, user_role: str, db: Session, revise: bool = True):
+    """
+    Validate, stream to disk and register one uploaded file.
+    Returns (resp, doc, is_new, save_path). Duplicates are removed from disk and resp
+    already describes the existing document. Raises HTTPException for rejected files.
+    revise=False registers a changed file as a new document instead of a new version
+    of the owner's previous upload with the same name.
     """
     filename = file.filename
     
     # Validate file type
-    allowed_extensions = {
-        '.pdf', '.docx', '.pptx', '.txt', '.md', '.csv',
-        '.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif'
-    }
+    allowed_extensions = SUPPORTED_EXTENSIONS
     file_ext = os.path.splitext(filename)[1].lower()
     
     if file_ext not in allowed_extensions:
@@ -41,12 +113,15 @@ async def upload_file(file: UploadFile = File(...), user_id: str = Form(...), us
     from datetime import datetime
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     base_name = os.path.splitext(filename)[0]
-    new_filename = f"{base_name}_{timestamp}{file_ext}"
-    save_path = os.path.join(user_dir, new_filename)
+    new_filename, save_path = _reserve_upload_path(user_dir, f"{base_name}_{timestamp}", file_ext)
 
-    contents = await file.read()
-    with open(save_path, "wb") as f:
-        f.write(contents)
+    try:
+        size_bytes, sha256 = await _stream_upload_to_disk(file, save_path)
+    except BaseException:
+        # Release the reserved name
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        raise
 
     resp = {
         "file_id": new_filename,  # Frontend expects file_id
@@ -56,46 +131,340 @@ async def upload_file(file: UploadFile = File(...), user_id: str = Form(...), us
         "user_id": user_id,
         "user_role": user_role,
         "file_type": file_ext,
-        "size_bytes": len(contents),
+        "size_bytes": size_bytes,
+        "sha256": sha256,
     }
 
-    # --- RAG Ingestion ---
+    # --- Deduplication by content hash ---
     try:
-        # Extract text
-        text = extract_text(save_path)
-        
-        if not text or len(text.strip()) < 10:
-            resp["ingestion_status"] = "warning"
-            resp["ingestion_message"] = "File uploaded but no text extracted (empty or unsupported content)"
-            return JSONResponse(resp)
-        
-        # Ingest into Vector Store
-        from backend.rag import ingest_document
-        num_chunks = ingest_document(save_path, text)
-        resp["ingestion_status"] = "success"
-        resp["chunks_added"] = num_chunks
-        resp["text_length"] = len(text)
-    except Exception as e:
-        print(f"Ingestion failed: {e}")
-        resp["ingestion_status"] = "failed"
-        resp["ingestion_error"] = str(e)
+        doc, is_new = documents.register_upload(
+            db, sha256=sha256, file_id=new_filename, saved_path=save_path, original_filename=filename,
+            file_type=file_ext, size_bytes=size_bytes, user_id=user_id, user_role=user_role, revise=revise,
+        )
+    except documents.RevisionInProgressError as e:
+        os.remove(save_path)
+        raise HTTPException(status_code=409, detail=str(e))
+    if not is_new:
+        # Identical bytes already registered: drop the new copy and point at the existing document
+        os.remove(save_path)
+        resp.update({
+            "file_id": doc.file_id,
+            "saved_filename": doc.file_id,
+            "saved_path": doc.saved_path,
+            "duplicate_of": doc.file_id,
+            "ingestion_status": _DUPLICATE_STATUS.get(doc.status, doc.status),
+            "chunks_added": 0,
+        })
+        if doc.status == documents.STATUS_PENDING and doc.job_id:
+            resp["job_id"] = doc.job_id
+            resp["status_url"] = f"/api/content/jobs/{doc.job_id}"
+        return resp, doc, False, save_path
+
+    resp["file_id"] = doc.file_id  # stable across revisions of the same document
+    resp["version"] = doc.version
+    return resp, doc, True, save_path
+
+
+@router.post("/upload")
+async def upload_file(file: UploadFile = File(...), user_id: str = Form(...), user_role: str = Form("teacher"),
+                      db: Session = Depends(get_db)):
+    """
+    Save uploaded file to the uploads/ folder and return metadata.
+    Supports: PDF, DOCX, PPTX, TXT, MD, CSV, and images (PNG, JPG, JPEG, BMP, TIFF, GIF)
+    Both teachers and students can upload.
+    Text extraction and embedding run in the background; poll status_url for progress.
+    Files whose bytes were uploaded before are not re-ingested: the existing file_id is returned.
+    """
+    resp, doc, is_new, save_path = await _save_upload(file, user_id, user_role, db)
+    if not is_new:
+        return JSONResponse(resp)
+
+    # --- RAG Ingestion (background) ---
+    job = IngestionJob(resp["saved_filename"], meta={"file_id": doc.file_id, "user_id": user_id, "user_role": user_role})
+    try:
+        submit_job(job, _run_ingestion, save_path, doc.file_id, doc.version, doc.sha256)
+    except QueueFullError as e:
+        doc.status = documents.STATUS_FAILED
+        db.commit()
+        os.remove(save_path)
+        raise HTTPException(status_code=503, detail=f"{e}. Please retry shortly.")
+
+    doc.job_id = job.id
+    db.commit()
+
+    resp["job_id"] = job.id
+    resp["ingestion_status"] = "queued"
+    resp["status_url"] = f"/api/content/jobs/{job.id}"
     # ---------------------
 
-    return JSONResponse(resp)
+    return JSONResponse(resp, status_code=202)
+
+
+@router.post("/upload_batch")
+async def upload_batch(files: List[UploadFile] = File(...), user_id: str = Form(...), user_role: str = Form("teacher"),
+                       db: Session = Depends(get_db)):
+    """
+    Upload many files in one request (e.g. a whole lecture pack).
+    Every file is validated, streamed to disk and deduplicated individually; the new ones are
+    ingested by a single background job that extracts them concurrently and writes their
+    embeddings in consolidated vector store batches. Returns per-file results and one job id.
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files. Maximum per batch is {MAX_BATCH_FILES}")
+
+    results = []
+    to_ingest = []
+    seen_names = set()
+    for file in files:
+        # Files sharing a name within one batch are separate documents, not versions of each other
+        revise = file.filename not in seen_names
+        seen_names.add(file.filename)
+        try:
+            resp, doc, is_new, save_path = await _save_upload(file, user_id, user_role, db, revise=revise)
+        except HTTPException as e:
+            results.append({"original_filename": file.filename, "ingestion_status": "rejected", "error": e.detail})
+            continue
+        results.append(resp)
+        if is_new:
+            to_ingest.append((resp, doc, save_path))
+
+    body = {"user_id": user_id, "user_role": user_role, "files": results}
+    if not to_ingest:
+        return JSONResponse(body)
+
+    job = IngestionJob(
+        f"batch of {len(to_ingest)} files",
+        meta={"file_ids": [doc.file_id for _, doc, _ in to_ingest], "user_id": user_id, "user_role": user_role},
+    )
+    items = [(save_path, doc.file_id, doc.version, doc.sha256) for _, doc, save_path in to_ingest]
+    try:
+        submit_job(job, _run_batch_ingestion, items)
+    except QueueFullError as e:
+        for _, doc, save_path in to_ingest:
+            doc.status = documents.STATUS_FAILED
+            os.remove(save_path)
+        db.commit()
+        raise HTTPException(status_code=503, detail=f"{e}. Please retry shortly.")
+
+    for resp, doc, _ in to_ingest:
+        doc.job_id = job.id
+        resp["job_id"] = job.id
+        resp["ingestion_status"] = "queued"
+        resp["status_url"] = f"/api/content/jobs/{job.id}"
+    db.commit()
+
+    body["job_id"] = job.id
+    body["status_url"] = f"/api/content/jobs/{job.id}"
+    return JSONResponse(body, status_code=202)
+
+
+# Registry status of the original upload -> ingestion_status reported for a duplicate
+_DUPLICATE_STATUS = {
+    documents.STATUS_INGESTED: "duplicate",
+    documents.STATUS_PENDING: "queued",
+    documents.STATUS_EMPTY: "warning",
+}
+
+
+def _run_ingestion(job: IngestionJob, save_path: str, file_id: str, version: int = 1, sha256: str = None):
+    """
+    Worker-side half of an upload: extract text and embed it into the vector store.
+    Runs on the ingestion pool, never on the event loop.
+    Revisions (version > 1) only embed chunks that changed since the previous version.
+    """
+    if os.path.getsize(save_path) >= STREAM_INGEST_MIN_BYTES:
+        return _run_streaming_ingestion(job, save_path, file_id, version, sha256)
+
+    try:
+        job.set_stage(STAGE_EXTRACTING)
+        pages = list(text_store.iter_document_pages(save_path, sha256=sha256, progress=job.page_progress))
+        text = "\n".join(page_text for _, page_text in pages)
+
+        if not text or len(text.strip()) < 10:
+            documents.update_document(file_id, status=documents.STATUS_EMPTY, text_length=len(text or ""))
+            job.finish({
+                "ingestion_status": "warning",
+                "ingestion_message": "File uploaded but no text extracted (empty or unsupported content)",
+            })
+            return
+
+        job.set_stage(STAGE_EMBEDDING)
+        from backend.rag import ingest_pages
+        stats = ingest_pages(file_id, pages, version=version, progress=job.chunk_progress)
+    except Exception:
+        documents.update_document(file_id, status=documents.STATUS_FAILED)
+        raise
+
+    num_chunks = stats["chunks_total"]
+    documents.update_document(file_id, status=documents.STATUS_INGESTED, chunk_count=num_chunks, text_length=len(text))
+    summaries.schedule_precompute(file_id)
+    job.finish({"ingestion_status": "success", "chunks_added": num_chunks, "text_length": len(text), **stats})
+
+
+def _run_streaming_ingestion(job: IngestionJob, save_path: str, file_id: str, version: int = 1, sha256: str = None):
+    """
+    Large-file variant of _run_ingestion: pages are extracted, chunked and embedded in
+    fixed-size batches as they stream through, so memory stays flat for any document size.
+    """
+    text_length = 0
+
+    def counted_pages():
+        nonlocal text_length
+        for page_number, text in text_store.iter_document_pages(save_path, sha256=sha256, progress=job.page_progress):
+            text_length += len(text)
+            yield page_number, text
+
+    try:
+        job.set_stage(STAGE_STREAMING)
+        from backend.rag import ingest_stream
+        stats = ingest_stream(file_id, counted_pages(), version=version, progress=job.chunk_progress)
+    except Exception:
+        documents.update_document(file_id, status=documents.STATUS_FAILED)
+        raise
+
+    num_chunks = stats["chunks_total"]
+    if num_chunks == 0:
+        documents.update_document(file_id, status=documents.STATUS_EMPTY, text_length=text_length)
+        job.finish({
+            "ingestion_status": "warning",
+            "ingestion_message": "File uploaded but no text extracted (empty or unsupported content)",
+        })
+        return
+
+    documents.update_document(file_id, status=documents.STATUS_INGESTED, chunk_count=num_chunks, text_length=text_length)
+    summaries.schedule_precompute(file_id)
+    job.finish({"ingestion_status": "success", "chunks_added": num_chunks, "text_length": text_length, **stats})
+
+
+def _run_batch_ingestion(job: IngestionJob, items: list):
+    """
+    Worker-side half of /upload_batch. items is [(save_path, file_id, version, sha256)].
+    Files are extracted concurrently and handed to rag.ingest_documents_batch as soon as each
+    finishes, so embedding overlaps extraction and writes are consolidated across files.
+    """
+    from backend.rag import ingest_documents_batch
+
+    per_file = {file_id: {"ingestion_status": "queued"} for _, file_id, _, _ in items}
+    job.set_stage(STAGE_STREAMING)
+    job.update_progress(files_total=len(items), files_extracted=0)
+
+    def extract(item):
+        save_path, _, _, sha256 = item
+        return list(text_store.iter_document_pages(save_path, sha256=sha256))
+
+    def extracted_documents():
+        with ThreadPoolExecutor(max_workers=BATCH_EXTRACT_WORKERS) as pool:
+            futures = {pool.submit(extract, item): item for item in items}
+            for n, future in enumerate(as_completed(futures), 1):
+                _, file_id, version, _ = futures[future]
+                job.update_progress(files_extracted=n)
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    print(f"Extraction failed for {file_id}: {e}")
+                    documents.update_document(file_id, status=documents.STATUS_FAILED)
+                    per_file[file_id] = {"ingestion_status": "failed", "ingestion_error": str(e)}
+                    continue
+                text = "\n".join(page_text for _, page_text in pages)
+                if not text or len(text.strip()) < 10:
+                    documents.update_document(file_id, status=documents.STATUS_EMPTY, text_length=len(text or ""))
+                    per_file[file_id] = {
+                        "ingestion_status": "warning",
+                        "ingestion_message": "File uploaded but no text extracted (empty or unsupported content)",
+                    }
+                    continue
+                per_file[file_id]["text_length"] = len(text)
+                yield file_id, pages, version
+
+    try:
+        all_stats = ingest_documents_batch(extracted_documents(), progress=job.chunk_progress)
+    except Exception:
+        for file_id, result in per_file.items():
+            if result["ingestion_status"] == "queued":
+                documents.update_document(file_id, status=documents.STATUS_FAILED)
+        raise
+
+    for file_id, stats in all_stats.items():
+        text_length = per_file[file_id].get("text_length", 0)
+        documents.update_document(
+            file_id, status=documents.STATUS_INGESTED, chunk_count=stats["chunks_total"], text_length=text_length
+        )
+        summaries.schedule_precompute(file_id)
+        per_file[file_id] = {"ingestion_status": "success", "chunks_added": stats["chunks_total"],
+                             "text_length": text_length, **stats}
+
+    job.finish({"files": per_file})
+
+
+@router.get("/jobs/{job_id}")
+def get_ingestion_job(job_id: str):
+    """
+    Poll the status of a background ingestion job started by /upload.
+    Reports the current stage, page/chunk progress and timings.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.get("/jobs")
+def get_ingestion_queue():
+    """Summary of the ingestion worker pool."""
+    return queue_stats()
 
 
 @router.post("/process_sync")
 async def process_sync(filename: str = Form(...)):
     """
-    Synchronous processing (simple): given a filename in uploads/, extract text and save preview JSON.
+    Synchronous processing (simple): given a filename in uploads/, extract text into the text store and return a preview.
+    Files that were extracted before are served from the store without re-parsing.
     Use this to test ingestion quickly.
     """
     file_path = os.path.join(UPLOADS_DIR, filename)
     if not os.path.exists(file_path):
         return JSONResponse({"error": "file not found", "path": file_path}, status_code=404)
     try:
-        text = extract_text(file_path)
-        preview_path = save_preview(text, file_path)
-        return JSONResponse({"status": "processed", "preview_path": preview_path, "length": len(text)})
+        sha256 = await run_in_threadpool(text_store.file_sha256, file_path)
+        if not text_store.has_document(sha256):
+            await run_in_threadpool(text_store.extract_document_text, file_path, sha256)
+        info = text_store.get_info(sha256)
+        return JSONResponse({
+            "status": "processed",
+            "sha256": sha256,
+            "length": info["text_length"],
+            "page_count": info["page_count"],
+            "preview": text_store.get_preview(sha256),
+        })
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@router.get("/preview/{file_id}")
+def get_preview(file_id: str, page: Optional[int] = None, chars: int = 2000, db: Session = Depends(get_db)):
+    """
+    Preview of an uploaded document's extracted text, read from the text store.
+    Without page: the first `chars` characters. With page (1-based): that page's text.
+    """
+    doc = documents.find_by_file_id(db, file_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    info = text_store.get_info(doc.sha256)
+    if info is None:
+        raise HTTPException(status_code=409, detail=f"Text not extracted yet (status: {doc.status})")
+
+    if page is not None:
+        text = text_store.get_page(doc.sha256, page)
+        if text is None:
+            raise HTTPException(status_code=404, detail=f"Page {page} not found (document has {info['page_count']} pages)")
+        text = text[:chars]
+    else:
+        text = text_store.get_preview(doc.sha256, chars)
+
+    return {
+        "file_id": file_id,
+        "page": page,
+        "page_count": info["page_count"],
+        "length": info["text_length"],
+        "preview": text,
+    }
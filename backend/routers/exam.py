@@ -1,3 +1,4 @@
+import os
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Optional
@@ -7,10 +8,68 @@ from datetime import datetime
 
 from backend.db import get_db
 from backend.models import QuizAttempt, QuizQuestion, User
-from backend.rag import query_knowledge_base
+from backend.rag import aretrieve_context
+from backend.tokenization import llm_token_budget, pack_context
+from backend import llm
+
+# Token budget (in LLM tokens) for retrieved material in the quiz prompt
+QUIZ_CONTEXT_TOKENS = int(os.getenv("QUIZ_CONTEXT_TOKENS", "2000"))
 
 router = APIRouter(prefix="/api/exam", tags=["exam"])
 
+QUIZ_CHAIN = llm.register_chain("quiz_generate", """
+You are Antigravity, an Expert AI Tutor and Adaptive Learning System running on Groq LLM infrastructure.
+
+CRITICAL RULE: All quiz content MUST be based EXCLUSIVELY on the provided document text. DO NOT introduce outside information.
+
+CRITICAL RULE 2 (JSON Fix): Your output MUST be a single, valid JSON object. DO NOT include any surrounding markdown markers like ```json or ```. Output ONLY the JSON object itself.
+
+TASK: Stage 2 - Quiz Generation
+
+Generate exactly {num_questions} quiz questions based on the following document content:
+
+DOCUMENT CONTENT:
+{context}
+
+REQUIREMENTS:
+
+1. **Question Count**: Generate EXACTLY {num_questions} questions.
+
+2. **Question Types**: Use a mix of Multiple Choice (MCQ) and True/False questions.
+
+3. **Source Verification**: ALL questions and options must be verifiable within the provided document text.
+
+4. **Schema Compliance**: Follow this EXACT structure:
+
+{{
+  "quiz_title": "Assessment on [Primary Topic from Document]",
+  "questions": [
+    {{
+      "id": 1,
+      "type": "MCQ",
+      "question": "Question text based on document content",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "answer_key": "Option A",
+      "explanation": "Brief explanation referencing the document text"
+    }},
+    {{
+      "id": 2,
+      "type": "True/False",
+      "question": "Statement to evaluate as true or false",
+      "options": ["True", "False"],
+      "answer_key": "True",
+      "explanation": "Brief explanation referencing the document text"
+    }}
+  ]
+}}
+
+CRITICAL OUTPUT INSTRUCTION:
+- Output ONLY the JSON object
+- NO markdown code blocks (no ```json or ```)
+- NO additional text before or after the JSON
+- Start directly with {{ and end directly with }}
+""", temperature=0.5)
+
 class QuizGenerateRequest(BaseModel):
     user_id: Optional[str] = "student_demo"
     topic: Optional[str] = None
@@ -66,14 +125,14 @@ async def generate_quiz(req: QuizGenerateRequest, db: Session = Depends(get_db))
     
     # If file_id is provided, filter results by source metadata
     if req.file_id:
-        results = query_knowledge_base(topic_query, k=15, filter={"source": req.file_id})
+        results = await aretrieve_context(topic_query, k=15, filter={"source": req.file_id})
         if not results:
             # Fallback: try without filter if no results
-            results = query_knowledge_base(topic_query, k=15)
+            results = await aretrieve_context(topic_query, k=15)
     else:
-        results = query_knowledge_base(topic_query, k=15)
+        results = await aretrieve_context(topic_query, k=15)
     
-    context_text = "\n\n".join([doc.page_content for doc in results])
+    context_text = pack_context([doc.page_content for doc in results], llm_token_budget(QUIZ_CONTEXT_TOKENS))
     
     if not context_text:
         raise HTTPException(status_code=400, detail="No content available to generate quiz. Please upload course materials first.")
@@ -92,72 +151,13 @@ async def generate_quiz(req: QuizGenerateRequest, db: Session = Depends(get_db))
     
     # Generate quiz using OpenAI
     try:
-        from langchain_groq import ChatGroq
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
         import os
         import json
         
         if not os.getenv("GROQ_API_KEY"):
             raise HTTPException(status_code=500, detail="Groq API key not configured. Get one free at https://console.groq.com")
         
-        llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0.5)
-        
-        prompt = ChatPromptTemplate.from_template("""
-You are Antigravity, an Expert AI Tutor and Adaptive Learning System running on Groq LLM infrastructure.
-
-CRITICAL RULE: All quiz content MUST be based EXCLUSIVELY on the provided document text. DO NOT introduce outside information.
-
-CRITICAL RULE 2 (JSON Fix): Your output MUST be a single, valid JSON object. DO NOT include any surrounding markdown markers like ```json or ```. Output ONLY the JSON object itself.
-
-TASK: Stage 2 - Quiz Generation
-
-Generate exactly {num_questions} quiz questions based on the following document content:
-
-DOCUMENT CONTENT:
-{context}
-
-REQUIREMENTS:
-
-1. **Question Count**: Generate EXACTLY {num_questions} questions.
-
-2. **Question Types**: Use a mix of Multiple Choice (MCQ) and True/False questions.
-
-3. **Source Verification**: ALL questions and options must be verifiable within the provided document text.
-
-4. **Schema Compliance**: Follow this EXACT structure:
-
-{{
-  "quiz_title": "Assessment on [Primary Topic from Document]",
-  "questions": [
-    {{
-      "id": 1,
-      "type": "MCQ",
-      "question": "Question text based on document content",
-      "options": ["Option A", "Option B", "Option C", "Option D"],
-      "answer_key": "Option A",
-      "explanation": "Brief explanation referencing the document text"
-    }},
-    {{
-      "id": 2,
-      "type": "True/False",
-      "question": "Statement to evaluate as true or false",
-      "options": ["True", "False"],
-      "answer_key": "True",
-      "explanation": "Brief explanation referencing the document text"
-    }}
-  ]
-}}
-
-CRITICAL OUTPUT INSTRUCTION:
-- Output ONLY the JSON object
-- NO markdown code blocks (no ```json or ```)
-- NO additional text before or after the JSON
-- Start directly with {{ and end directly with }}
-""")
-        
-        chain = prompt | llm | StrOutputParser()
-        response_text = chain.invoke({"num_questions": target_questions, "context": context_text[:8000]})
+        response_text = await QUIZ_CHAIN.ainvoke({"num_questions": target_questions, "context": context_text})
         
         # CRITICAL: Clean up response - remove markdown code blocks if present
         response_text = response_text.strip()
@@ -7,10 +7,37 @@ from datetime import datetime
 
 from backend.db import get_db
 from backend.models import HomeworkSession, User
-from backend.rag import query_knowledge_base
+from backend.rag import aretrieve_context
+from backend import llm
 
 router = APIRouter(prefix="/api/homework", tags=["homework"])
 
+HOMEWORK_CHAIN = llm.register_chain("homework_solve", """
+        You are a helpful AI Tutor. A student needs help with the following problem:
+        
+        Problem: {problem}
+        
+        Context from course materials:
+        {context}
+        
+        Provide a response in JSON format with the following structure:
+        {{
+            "hints": ["hint1", "hint2", "hint3"],
+            "solution": "full step-by-step solution"
+        }}
+        
+        Instructions:
+        1. "hints": Provide 3 progressive hints. 
+           - Hint 1: A small nudge or question to get them started.
+           - Hint 2: A more specific clue about the method or concept.
+           - Hint 3: A strong clue that almost reveals the next step.
+           - Do NOT reveal the final answer in the hints.
+        
+        2. "solution": Provide a complete, clear, step-by-step explanation of the solution.
+           - Explain the 'why', not just the 'how'.
+           - Use the provided context if relevant.
+        """, temperature=0)
+
 class HomeworkRequest(BaseModel):
     user_id: str
     problem: str
@@ -53,7 +80,7 @@ async def solve_homework(req: HomeworkRequest, db: Session = Depends(get_db)):
         db.refresh(user)
     
     # Retrieve context from uploaded materials
-    results = query_knowledge_base(req.problem, k=3)
+    results = await aretrieve_context(req.problem, k=3)
     context_text = "\n\n".join([f"[Source: {doc.metadata.get('source', 'unknown')}]\n{doc.page_content}" for doc in results])
     
     if not context_text:
@@ -61,45 +88,13 @@ async def solve_homework(req: HomeworkRequest, db: Session = Depends(get_db)):
     
     # Generate step-by-step solution with hints using OpenAI
     try:
-        from langchain_groq import ChatGroq
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
         import os
         import json
         
         if not os.getenv("GROQ_API_KEY"):
             raise HTTPException(status_code=500, detail="Groq API key not configured. Get one free at https://console.groq.com")
         
-        llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0)
-        
-        prompt = ChatPromptTemplate.from_template("""
-        You are a helpful AI Tutor. A student needs help with the following problem:
-        
-        Problem: {problem}
-        
-        Context from course materials:
-        {context}
-        
-        Provide a response in JSON format with the following structure:
-        {{
-            "hints": ["hint1", "hint2", "hint3"],
-            "solution": "full step-by-step solution"
-        }}
-        
-        Instructions:
-        1. "hints": Provide 3 progressive hints. 
-           - Hint 1: A small nudge or question to get them started.
-           - Hint 2: A more specific clue about the method or concept.
-           - Hint 3: A strong clue that almost reveals the next step.
-           - Do NOT reveal the final answer in the hints.
-        
-        2. "solution": Provide a complete, clear, step-by-step explanation of the solution.
-           - Explain the 'why', not just the 'how'.
-           - Use the provided context if relevant.
-        """)
-        
-        chain = prompt | llm | StrOutputParser()
-        response_text = chain.invoke({"problem": req.problem, "context": context_text})
+        response_text = await HOMEWORK_CHAIN.ainvoke({"problem": req.problem, "context": context_text})
         
         # Parse JSON response
         try:
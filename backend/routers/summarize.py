@@ -1,20 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import Optional, List, Union, Any
+from typing import Optional, List, Union, Any, Literal
 from sqlalchemy.orm import Session
 import logging
 import traceback
 
 from backend.db import get_db
 import backend.rag as rag_module 
+from backend import summaries
 from backend.dependencies import get_current_user_optional
 
-# Try to import potential DB model names safely
-try:
-    from backend.models import ContentSummary 
-except Exception:
-    ContentSummary = None
-
 logger = logging.getLogger("backend.summarize")
 router = APIRouter(prefix="/api/content", tags=["content"]) 
 
@@ -23,6 +18,8 @@ class SummarizeRequest(BaseModel):
     file_id: Optional[str] = None
     text: Optional[str] = None
     max_length: Optional[int] = 300
+    # Defaults to the server's SUMMARY_MODE; anything else is rejected with 422
+    mode: Optional[Literal["sample", "map_reduce"]] = None
 
 
 class SummarizeResponse(BaseModel):
@@ -49,12 +46,9 @@ def summarize_endpoint(request: SummarizeRequest, db: Session = Depends(get_db))
         summary_result = None
 
         if request.file_id:
-            # Check for summarize_document
-            if hasattr(rag_module, "summarize_document"):
-                logger.info("Calling rag_module.summarize_document for file_id=%s", request.file_id)
-                summary_result = rag_module.summarize_document(request.file_id, max_length=request.max_length)
-            elif hasattr(rag_module, "summarize_file"):
-                summary_result = rag_module.summarize_file(request.file_id, max_length=request.max_length)
+            # Stored summary of the current document version (generated and stored on a miss)
+            logger.info("Loading summary for file_id=%s", request.file_id)
+            summary_result = summaries.get_summary(request.file_id, max_length=request.max_length, mode=request.mode)
         elif request.text and hasattr(rag_module, "summarize_text"):
             logger.info("Calling rag_module.summarize_text for text input")
             summary_result = rag_module.summarize_text(request.text, max_length=request.max_length)
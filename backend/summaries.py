@@ -0,0 +1,216 @@
+# backend/summaries.py
+"""
+Persistent store of generated document summaries.
+
+A summary is stored per (file_id, document version, prompt version, mode), so
+opening a document's summary is a database read once it has been generated.
+max_length is not part of the key: the summarizer's output does not depend on
+it, so rows only record the length they were generated with. Summaries are
+precomputed on a small background pool right after ingestion, and a request
+arriving while that is still running waits for it instead of calling the LLM a
+second time. Only summaries of fully ingested documents are stored; a request
+for a document that is still being ingested is answered without storing, since
+its chunks are incomplete. Finishing an ingestion drops the document's stored
+summaries and schedules the new one.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from backend.db import SessionLocal
+from backend.models import ContentSummary
+
+# Precompute summaries after ingestion (needs GROQ_API_KEY)
+SUMMARY_PRECOMPUTE = os.getenv("SUMMARY_PRECOMPUTE", "true").lower() == "true"
+# Concurrent background summary generations
+SUMMARY_PRECOMPUTE_WORKERS = int(os.getenv("SUMMARY_PRECOMPUTE_WORKERS", "1"))
+# max_length summaries are precomputed with (what the upload page requests)
+SUMMARY_PRECOMPUTE_MAX_LENGTH = int(os.getenv("SUMMARY_PRECOMPUTE_MAX_LENGTH", "500"))
+
+_executor = ThreadPoolExecutor(max_workers=SUMMARY_PRECOMPUTE_WORKERS, thread_name_prefix="summary")
+# key -> Future of the generation in progress
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def document_state(file_id: str):
+    """
+    (version, ingested) of a document: registry first, then its chunk manifest
+    (written once ingestion finishes). (None, False) when neither knows it.
+    """
+    from backend import chunk_manifest, documents
+
+    db = SessionLocal()
+    try:
+        doc = documents.find_by_file_id(db, file_id)
+    finally:
+        db.close()
+    if doc is not None:
+        return doc.version or 1, doc.status == documents.STATUS_INGESTED
+    manifest = chunk_manifest.get(file_id)
+    return (manifest["version"], True) if manifest else (None, False)
+
+
+def _summary_key(file_id: str, mode: str = None):
+    """(key, ingested) for the current version of a document; key is None for unknown documents."""
+    from backend import rag
+
+    mode = (mode or rag.SUMMARY_MODE).lower()
+    if mode not in rag.SUMMARY_MODES:
+        # Part of the key: an arbitrary value would store (and generate) a summary of its own
+        raise ValueError(f"Unknown summary mode: {mode!r} (expected one of {', '.join(rag.SUMMARY_MODES)})")
+    version, ingested = document_state(file_id)
+    if version is None:
+        return None, False
+    return (file_id, version, rag.summary_prompt_version(mode), mode), ingested
+
+
+def get_stored(key):
+    file_id, version, prompt_version, mode = key
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            select(ContentSummary).where(
+                ContentSummary.file_id == file_id,
+                ContentSummary.version == version,
+                ContentSummary.prompt_version == prompt_version,
+                ContentSummary.mode == mode,
+            )
+        ).scalars().first()
+        return json.loads(row.summary_json) if row else None
+    finally:
+        db.close()
+
+
+def _store(key, max_length: int, summary: dict, seconds: float):
+    file_id, version, prompt_version, mode = key
+    db = SessionLocal()
+    try:
+        db.add(ContentSummary(
+            file_id=file_id,
+            version=version,
+            prompt_version=prompt_version,
+            mode=mode,
+            max_length=max_length,
+            topic=summary.get("topic"),
+            summary_json=json.dumps(summary),
+            generation_seconds=round(seconds, 3),
+        ))
+        db.commit()
+    except IntegrityError:
+        # Stored concurrently by another process
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _is_cacheable(summary) -> bool:
+    # Error and empty placeholders, and sampled fallbacks of a failed map-reduce, are not worth keeping
+    return (
+        isinstance(summary, dict)
+        and summary.get("topic") not in ("Error", "Empty")
+        and "fallback" not in summary
+    )
+
+
+def _generate(key, max_length: int) -> dict:
+    from backend import rag
+
+    file_id, version, _, mode = key
+    started = time.perf_counter()
+    summary = rag.summarize_document(file_id, max_length=max_length, mode=mode)
+    # Re-uploaded while generating: the summary may mix old and new chunks
+    if _is_cacheable(summary) and document_state(file_id) == (version, True):
+        _store(key, max_length, summary, time.perf_counter() - started)
+    return summary
+
+
+def _generate_once(key, max_length: int) -> dict:
+    """Generates the summary for key, sharing one generation between concurrent callers."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[key] = future
+    if not owner:
+        return future.result()
+
+    try:
+        # Another process may have stored it while this one was not looking
+        summary = get_stored(key) or _generate(key, max_length)
+        future.set_result(summary)
+        return summary
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def get_summary(file_id: str, max_length: int = SUMMARY_PRECOMPUTE_MAX_LENGTH, mode: str = None) -> dict:
+    """Stored summary of the current document version, generated (and stored) on a miss."""
+    from backend import rag
+
+    max_length = max_length or SUMMARY_PRECOMPUTE_MAX_LENGTH
+    key, ingested = _summary_key(file_id, mode)
+    if key is None:
+        # Not a registered or ingested document: nothing to key the summary on
+        return rag.summarize_document(file_id, max_length=max_length, mode=mode)
+    stored = get_stored(key)
+    if stored is not None:
+        return stored
+    if not ingested:
+        # Still being ingested: share a generation already running, otherwise
+        # summarize what is there without storing it
+        with _inflight_lock:
+            future = _inflight.get(key)
+        if future is not None:
+            return future.result()
+        return rag.summarize_document(file_id, max_length=max_length, mode=mode)
+    return _generate_once(key, max_length)
+
+
+def invalidate(file_id: str, keep_version: int = None):
+    """Deletes a document's stored summaries, except those of keep_version."""
+    db = SessionLocal()
+    try:
+        stmt = delete(ContentSummary).where(ContentSummary.file_id == file_id)
+        if keep_version is not None:
+            stmt = stmt.where(ContentSummary.version != keep_version)
+        db.execute(stmt)
+        db.commit()
+    finally:
+        db.close()
+
+
+def schedule_precompute(file_id: str, mode: str = None):
+    """
+    Called after a document is (re-)ingested: drops its stored summaries (the
+    content just changed, even when the version did not) and generates the current
+    one in the background. Never raises.
+    """
+    try:
+        invalidate(file_id)
+        key, ingested = _summary_key(file_id, mode)
+        if key is None or not ingested:
+            return
+        if not SUMMARY_PRECOMPUTE or not os.getenv("GROQ_API_KEY"):
+            return
+        _executor.submit(_precompute, key)
+    except Exception as e:
+        print(f"Summary precompute scheduling failed for {file_id}: {e}")
+
+
+def _precompute(key):
+    try:
+        if get_stored(key) is None:
+            _generate_once(key, SUMMARY_PRECOMPUTE_MAX_LENGTH)
+    except Exception as e:
+        print(f"Summary precompute failed for {key[0]}: {e}")
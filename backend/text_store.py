@@ -0,0 +1,183 @@
+# backend/text_store.py
+"""
+Persistent store of extracted document text, keyed by the SHA-256 of the file bytes.
+
+Each page (PDF page, PPTX slide, text block) is stored zlib-compressed in its own
+row of a small SQLite database, so a single page can be read without touching
+the rest of the document. Ingestion, summarization and the preview endpoints all
+read from here, so a file is parsed at most once in its lifetime.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+
+from backend.ingest_utils import iter_text_pages
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEXT_STORE_PATH = os.getenv("TEXT_STORE_PATH", os.path.join(PROJECT_ROOT, "text_store.db"))
+TEXT_STORE_COMPRESSION_LEVEL = int(os.getenv("TEXT_STORE_COMPRESSION_LEVEL", "6"))
+# Pages buffered and written per transaction while storing a document
+TEXT_STORE_COMMIT_PAGES = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    sha256 TEXT PRIMARY KEY,
+    page_count INTEGER NOT NULL,
+    text_length INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    sha256 TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text_length INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (sha256, page)
+) WITHOUT ROWID;
+"""
+
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(TEXT_STORE_PATH, timeout=30)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def has_document(sha256: str) -> bool:
+    conn = _connect()
+    try:
+        return conn.execute("SELECT 1 FROM documents WHERE sha256 = ?", (sha256,)).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def get_info(sha256: str):
+    """Returns {"sha256", "page_count", "text_length"} or None if the document is not stored."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT page_count, text_length FROM documents WHERE sha256 = ?", (sha256,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"sha256": sha256, "page_count": row[0], "text_length": row[1]}
+
+
+def get_page(sha256: str, page: int):
+    """Random access to one page (1-based). Returns None if missing."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT data FROM pages WHERE sha256 = ? AND page = ?", (sha256, page)).fetchone()
+    finally:
+        conn.close()
+    return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+
+def iter_pages(sha256: str, start_page: int = 1):
+    """Yields (page_number, text) in page order, decompressing one page at a time."""
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "SELECT page, data FROM pages WHERE sha256 = ? AND page >= ? ORDER BY page", (sha256, start_page)
+        )
+        for page, data in cursor:
+            yield page, zlib.decompress(data).decode("utf-8")
+    finally:
+        conn.close()
+
+
+def get_text(sha256: str):
+    """Full document text, pages joined with newlines (same as ingest_utils.extract_text)."""
+    if not has_document(sha256):
+        return None
+    return "\n".join(text for _, text in iter_pages(sha256))
+
+
+def get_preview(sha256: str, chars: int = 2000):
+    """First `chars` characters of the document, reading only as many pages as needed."""
+    parts, length = [], 0
+    for _, text in iter_pages(sha256):
+        parts.append(text)
+        length += len(text) + 1
+        if length >= chars:
+            break
+    return "\n".join(parts)[:chars]
+
+
+def _write_pages(conn, sha256: str, batch: list):
+    conn.executemany(
+        "INSERT OR REPLACE INTO pages (sha256, page, text_length, data) VALUES (?, ?, ?, ?)",
+        [
+            (sha256, page, len(text), zlib.compress(text.encode("utf-8"), TEXT_STORE_COMPRESSION_LEVEL))
+            for page, text in batch
+        ],
+    )
+    conn.commit()
+
+
+def put_pages(sha256: str, pages):
+    """
+    Stores an iterable of (page_number, text) under sha256 and yields the pages back,
+    so it can sit inside a streaming pipeline. The document is only marked complete
+    (and visible to has_document) once the iterable has been fully consumed.
+    Pages are written TEXT_STORE_COMMIT_PAGES at a time, each batch in its own short
+    transaction: the consumer embeds between yields, and holding the write lock
+    across that would block every other writer of the store.
+    """
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM pages WHERE sha256 = ?", (sha256,))
+        conn.commit()
+        batch, page_count, text_length = [], 0, 0
+        for page, text in pages:
+            text = text or ""
+            batch.append((page, text))
+            page_count += 1
+            text_length += len(text)
+            yield page, text
+            if len(batch) >= TEXT_STORE_COMMIT_PAGES:
+                _write_pages(conn, sha256, batch)
+                batch = []
+        if batch:
+            _write_pages(conn, sha256, batch)
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (sha256, page_count, text_length, created_at) VALUES (?, ?, ?, ?)",
+            (sha256, page_count, text_length, time.time()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def iter_document_pages(path: str, sha256: str = None, progress=None):
+    """
+    Yields (page_number, text) for a file, from the store when it has been extracted
+    before and otherwise by extracting it (and storing the result on the way through).
+    """
+    sha256 = sha256 or file_sha256(path)
+    if has_document(sha256):
+        yield from iter_pages(sha256)
+        return
+    yield from put_pages(sha256, iter_text_pages(path, progress=progress))
+
+
+def extract_document_text(path: str, sha256: str = None, progress=None) -> str:
+    """Drop-in, store-backed replacement for ingest_utils.extract_text."""
+    return "\n".join(text for _, text in iter_document_pages(path, sha256=sha256, progress=progress))
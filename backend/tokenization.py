@@ -0,0 +1,164 @@
+# backend/tokenization.py
+"""
+Shared tokenizer for chunking and prompt budgeting.
+
+Uses the embedding model's fast (Rust) tokenizer from the `tokenizers`
+package, loaded once per process from the model's local files (the
+sentence-transformers / Hugging Face cache the embedding model is loaded from;
+loading the embedding model puts it there). It is never fetched from the
+network here. Chunks sized in these tokens
+always fit the embedding model's window, and prompt context is packed to a
+token budget instead of a character count.
+
+Chunk boundaries (and so chunk hashes, incremental re-ingestion and the
+embedding cache) depend on the tokenizer, so chunking refuses to run without it
+(require_tokenizer) unless TOKENIZER_FALLBACK=approx opts into an approximate
+word-piece count everywhere. Prompt budgeting always works: it falls back to the
+approximation.
+
+Prompt budgets are counted with this (MiniLM WordPiece) tokenizer, but the
+prompts go to a Llama 3 model whose BPE vocabulary needs about 10-20% fewer
+tokens for English prose and can need more for numbers, code or non-Latin
+text. llm_token_budget converts an LLM token budget into a WordPiece budget
+with LLM_TOKEN_RATIO as the safety margin.
+
+Token counts of short strings are memoized: the recursive splitter measures the
+same pieces many times while merging them into chunks.
+"""
+import functools
+import os
+import re
+
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+# Explicit tokenizer.json to use instead of looking up TOKENIZER_NAME
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH")
+# "approx" allows chunking with the approximate counter when the tokenizer is unavailable
+TOKENIZER_FALLBACK = os.getenv("TOKENIZER_FALLBACK", "").lower()
+# Upper bound of LLM (Llama 3) tokens per counted token, used as the prompt-budget safety margin
+LLM_TOKEN_RATIO = float(os.getenv("LLM_TOKEN_RATIO", "1.2"))
+# Strings up to this length have their token count memoized
+_CACHED_TEXT_CHARS = 2048
+_COUNT_CACHE_SIZE = 16384
+# Truncation encodes only this many characters per requested token before falling back to the full text
+_CHARS_PER_TOKEN_BOUND = 16
+
+# Approximation: words split into pieces of at most 6 characters, punctuation counted separately
+_APPROX_RE = re.compile(r"\w{1,6}|[^\w\s]", re.UNICODE)
+
+
+def _local_tokenizer_file():
+    """tokenizer.json of TOKENIZER_NAME from the local model caches, without network access."""
+    if TOKENIZER_PATH:
+        return TOKENIZER_PATH
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        for cache_dir in (os.getenv("SENTENCE_TRANSFORMERS_HOME"), None):
+            path = try_to_load_from_cache(TOKENIZER_NAME, "tokenizer.json", cache_dir=cache_dir)
+            if isinstance(path, str):
+                return path
+    except ImportError:
+        pass
+    # Older sentence-transformers releases kept models in their own cache directory
+    legacy = os.path.join(
+        os.getenv("SENTENCE_TRANSFORMERS_HOME", os.path.join(os.path.expanduser("~"), ".cache", "torch", "sentence_transformers")),
+        TOKENIZER_NAME.replace("/", "_"),
+        "tokenizer.json",
+    )
+    return legacy if os.path.exists(legacy) else None
+
+
+@functools.lru_cache(maxsize=1)
+def get_tokenizer():
+    """The process-wide tokenizers.Tokenizer, or None when unavailable."""
+    try:
+        from tokenizers import Tokenizer
+        path = _local_tokenizer_file()
+        if path is None:
+            raise RuntimeError("tokenizer.json not found in the local model cache")
+        tokenizer = Tokenizer.from_file(path)
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        return tokenizer
+    except Exception as e:
+        print(f"Tokenizer {TOKENIZER_NAME} unavailable ({e}); prompt budgets use approximate token counts")
+        return None
+
+
+def require_tokenizer():
+    """
+    Called before chunking: raises unless the real tokenizer is loaded, so chunk boundaries never
+    silently depend on whether this process could reach the tokenizer files.
+    """
+    if get_tokenizer() is None:
+        # The embedding model may have been downloaded since the last attempt
+        get_tokenizer.cache_clear()
+    if get_tokenizer() is None and TOKENIZER_FALLBACK != "approx":
+        raise RuntimeError(
+            f"Tokenizer {TOKENIZER_NAME} is unavailable, so documents cannot be chunked consistently. "
+            "Load the embedding model once while online, point TOKENIZER_PATH at its tokenizer.json, "
+            "or set TOKENIZER_FALLBACK=approx (changes chunk boundaries for every document)."
+        )
+
+
+def llm_token_budget(llm_tokens: int) -> int:
+    """Budget in counted tokens that stays within llm_tokens of the LLM's tokenizer."""
+    return max(1, int(llm_tokens / LLM_TOKEN_RATIO))
+
+
+def token_offsets(text: str) -> list:
+    """(start, end) character offsets of every token in text, without special tokens."""
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return tokenizer.encode(text, add_special_tokens=False).offsets
+    return [m.span() for m in _APPROX_RE.finditer(text)]
+
+
+@functools.lru_cache(maxsize=_COUNT_CACHE_SIZE)
+def _count_cached(text: str) -> int:
+    return len(token_offsets(text))
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if len(text) <= _CACHED_TEXT_CHARS:
+        return _count_cached(text)
+    return len(token_offsets(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text holding at most max_tokens tokens, cut at a token boundary."""
+    if not text or max_tokens <= 0:
+        return ""
+    # Encode a bounded prefix first so truncating a whole book does not tokenize all of it
+    prefix = text[:max_tokens * _CHARS_PER_TOKEN_BOUND]
+    offsets = token_offsets(prefix)
+    if len(offsets) <= max_tokens:
+        if len(prefix) == len(text):
+            return text
+        offsets = token_offsets(text)
+        if len(offsets) <= max_tokens:
+            return text
+    return text[:offsets[max_tokens - 1][1]]
+
+
+def pack_context(texts, max_tokens: int, separator: str = "\n\n", min_partial_tokens: int = 32) -> str:
+    """
+    Joins texts in order until max_tokens is reached. The first text that does not fit is
+    truncated at a token boundary to fill the remaining budget (unless fewer than
+    min_partial_tokens remain); later texts are dropped.
+    """
+    parts, used = [], 0
+    for text in texts:
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        if used + tokens <= max_tokens:
+            parts.append(text)
+            used += tokens
+            continue
+        remaining = max_tokens - used
+        if remaining >= min_partial_tokens or not parts:
+            parts.append(truncate_to_tokens(text, remaining))
+        break
+    return separator.join(parts)
@@ -0,0 +1,338 @@
+# backend/vector_index.py
+"""
+In-process, memory-mapped NumPy vector index (alternative to Chroma).
+
+Embeddings are appended to one contiguous file (float32, or float16 with
+VECTOR_INDEX_DTYPE=float16) that is read through np.memmap, so several
+uvicorn workers share a single copy through the OS page cache. Chunk ids,
+texts and metadata live in a SQLite table next to it; the row number links
+the two. Search is a brute-force matrix-vector product over the live rows
+(optionally only the rows of one source).
+
+The class mimics the subset of the chromadb Collection API that backend/rag.py
+uses (add, update, delete, get, query, count), so rag can use either store.
+Deleted chunks are tombstoned; their vectors stay in the file until compact().
+"""
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(PROJECT_ROOT, "vector_index"))
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+# Rows per block when scanning the whole matrix (bounds the float32 working copy for float16 files)
+SCAN_BLOCK_ROWS = 65536
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    source TEXT,
+    document TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_chunks_source ON chunks (source);
+"""
+
+
+def _where_source(where: dict):
+    """Only {"source": value} filters are supported (that is all rag uses)."""
+    if not where:
+        return None
+    if set(where) != {"source"}:
+        raise ValueError(f"Unsupported filter for the NumPy vector index: {where}")
+    source = where["source"]
+    if isinstance(source, dict):
+        if set(source) != {"$eq"}:
+            raise ValueError(f"Unsupported filter for the NumPy vector index: {where}")
+        source = source["$eq"]
+    return source
+
+
+class VectorIndex:
+    def __init__(self, directory: str = VECTOR_INDEX_DIR, dtype: str = VECTOR_INDEX_DTYPE):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, "chunks.db")
+        self.vectors_path = os.path.join(directory, "embeddings.bin")
+        self._lock = threading.Lock()
+        self._mmap = None
+        # Per-process view of the live rows, rebuilt when another writer bumps the generation
+        self._loaded_generation = None
+        self._file_epoch = None
+        self._live_rows = None
+        self._source_rows = {}
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dtype', ?)", (dtype,))
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', '0')")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('file_epoch', '0')")
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+        self.dtype = np.dtype(meta["dtype"])
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    # --- Writes -----------------------------------------------------------------
+
+    def _begin_write(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+
+    def _end_write(self, conn):
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+        conn.execute("COMMIT")
+
+    def add(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        conn = self._connect()
+        try:
+            self._begin_write(conn)
+            if self.dim is None:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+                self.dim = int(row[0]) if row else matrix.shape[1]
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match index ({self.dim})")
+
+            # Row numbers come from the file size, which only changes under this write lock
+            row_bytes = self.dim * self.dtype.itemsize
+            size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            first_row = size // row_bytes
+            with open(self.vectors_path, "ab") as f:
+                if size % row_bytes:
+                    # Drop a torn tail from an interrupted write. Only here: Windows refuses to
+                    # truncate a file that is memory-mapped, so release our map first.
+                    self._release_map()
+                    f.truncate(first_row * row_bytes)
+                f.write(matrix.astype(self.dtype).tobytes())
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, source, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (first_row + i, chunk_id, (meta or {}).get("source"), doc, json.dumps(meta or {}))
+                    for i, (chunk_id, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                ],
+            )
+            self._end_write(conn)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def update(self, ids: list, metadatas: list = None, documents: list = None, embeddings: list = None):
+        if not ids:
+            return
+        if embeddings is not None or documents is not None:
+            raise ValueError("The NumPy vector index only supports metadata updates; delete and re-add instead")
+        conn = self._connect()
+        try:
+            self._begin_write(conn)
+            conn.executemany(
+                "UPDATE chunks SET source = ?, metadata = ? WHERE id = ?",
+                [((meta or {}).get("source"), json.dumps(meta or {}), chunk_id) for chunk_id, meta in zip(ids, metadatas)],
+            )
+            self._end_write(conn)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def delete(self, ids: list = None, where: dict = None):
+        conn = self._connect()
+        try:
+            self._begin_write(conn)
+            if ids:
+                conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            elif where:
+                conn.execute("DELETE FROM chunks WHERE source = ?", (_where_source(where),))
+            self._end_write(conn)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def compact(self):
+        """
+        Rewrites the vector file without tombstoned rows. Other processes pick up the new file on
+        their next query; run it while nothing is ingesting. On Windows the file cannot be replaced
+        while another process has it mapped, so stop the server before compacting there.
+        """
+        conn = self._connect()
+        try:
+            self._begin_write(conn)
+            rows = [r for (r,) in conn.execute("SELECT row FROM chunks ORDER BY row")]
+            if self.dim is not None:
+                vectors = self._vectors(max(rows) + 1 if rows else 0)
+                tmp = self.vectors_path + ".tmp"
+                with open(tmp, "wb") as f:
+                    for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                        f.write(np.ascontiguousarray(vectors[rows[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+                conn.execute("UPDATE chunks SET row = -row - 1")
+                conn.executemany("UPDATE chunks SET row = ? WHERE row = ?", [(new, -old - 1) for new, old in enumerate(rows)])
+                # The old file must not be mapped while it is replaced (Windows refuses)
+                del vectors
+                self._release_map()
+                os.replace(tmp, self.vectors_path)
+                conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'file_epoch'")
+            self._end_write(conn)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    # --- Reads ------------------------------------------------------------------
+
+    def _release_map(self):
+        # Readers still holding the old map keep it alive until they are done
+        with self._lock:
+            self._mmap = None
+
+    def _vectors(self, min_rows: int):
+        """Read-only memory map covering at least min_rows rows, remapped when the file has grown."""
+        with self._lock:
+            if self._mmap is None or self._mmap.shape[0] < min_rows:
+                rows = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+                self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+            return self._mmap
+
+    def _refresh_rows(self, conn):
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('generation', 'file_epoch', 'dim')"))
+        generation = int(meta["generation"])
+        if self.dim is None and "dim" in meta:
+            self.dim = int(meta["dim"])
+        with self._lock:
+            if meta["file_epoch"] != self._file_epoch:
+                # compact() replaced the vector file: drop the map of the old one
+                self._mmap = None
+                self._file_epoch = meta["file_epoch"]
+            if generation == self._loaded_generation:
+                return
+        rows, sources = [], {}
+        for row, source in conn.execute("SELECT row, source FROM chunks ORDER BY row"):
+            rows.append(row)
+            sources.setdefault(source, []).append(row)
+        with self._lock:
+            self._live_rows = np.asarray(rows, dtype=np.int64)
+            self._source_rows = {s: np.asarray(r, dtype=np.int64) for s, r in sources.items()}
+            self._loaded_generation = generation
+
+    def count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _fetch(self, conn, column: str, keys: list):
+        """(key, id, document, metadata, row) for the given ids/row numbers, in the order given (missing ones skipped)."""
+        found = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            for record in conn.execute(
+                f"SELECT {column}, id, document, metadata, row FROM chunks WHERE {column} IN ({placeholders})", part
+            ):
+                found[record[0]] = record
+        return [found[k] for k in keys if k in found]
+
+    def _shape(self, records, include) -> dict:
+        result = {"ids": [r[1] for r in records]}
+        if "documents" in include:
+            result["documents"] = [r[2] for r in records]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(r[3]) for r in records]
+        if "embeddings" in include:
+            if records:
+                vectors = self._vectors(max(r[4] for r in records) + 1)
+                # Copies, so callers never keep the file mapped
+                result["embeddings"] = [np.array(vectors[r[4]], dtype=np.float32) for r in records]
+            else:
+                result["embeddings"] = []
+        return result
+
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None,
+            include=("documents", "metadatas")):
+        conn = self._connect()
+        try:
+            if ids is not None:
+                records = self._fetch(conn, "id", list(ids))
+            else:
+                sql, params = "SELECT row, id, document, metadata, row FROM chunks", []
+                source = _where_source(where)
+                if where:
+                    sql += " WHERE source = ?"
+                    params.append(source)
+                sql += " ORDER BY row"
+                if limit or offset:
+                    sql += " LIMIT ? OFFSET ?"
+                    params += [limit if limit else -1, offset or 0]
+                records = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return self._shape(records, include)
+
+    def query(self, query_embeddings: list, n_results: int = 10, where: dict = None,
+              include=("documents", "metadatas", "distances")):
+        """Cosine top-k. Returns Chroma-shaped lists of lists (one per query); distances are 1 - cosine."""
+        source = _where_source(where)
+        keys = ["ids"] + [key for key in ("documents", "metadatas", "embeddings", "distances") if key in include]
+        conn = self._connect()
+        try:
+            self._refresh_rows(conn)
+            with self._lock:
+                rows = self._source_rows.get(source) if where else self._live_rows
+            if rows is None or len(rows) == 0 or self.dim is None:
+                return {key: [[] for _ in query_embeddings] for key in keys}
+
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+            vectors = self._vectors(int(rows[-1]) + 1)
+
+            scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+            contiguous = where is None and int(rows[-1]) - int(rows[0]) + 1 == len(rows)
+            for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                if contiguous:
+                    # All rows live and adjacent: scan the mapped file directly without gathering
+                    block = vectors[int(rows[start]):int(rows[start]) + min(SCAN_BLOCK_ROWS, len(rows) - start)]
+                else:
+                    block = vectors[rows[start:start + SCAN_BLOCK_ROWS]]
+                scores[:, start:start + len(block)] = queries @ np.asarray(block, dtype=np.float32).T
+
+            k = min(n_results, len(rows))
+            result = {key: [] for key in keys}
+            for q_scores in scores:
+                top = np.argpartition(-q_scores, k - 1)[:k]
+                top = top[np.argsort(-q_scores[top])]
+                score_by_row = {int(rows[i]): float(q_scores[i]) for i in top}
+                # Rows deleted since _refresh_rows are simply skipped
+                records = self._fetch(conn, "row", list(score_by_row))
+                for key, values in self._shape(records, include).items():
+                    result[key].append(values)
+                if "distances" in include:
+                    result["distances"].append([1.0 - score_by_row[r[0]] for r in records])
+        finally:
+            conn.close()
+        return result